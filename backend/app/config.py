@@ -7,6 +7,95 @@ class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_SERVICE_ROLE_KEY: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "your-secret-key")
+    JWT_AUDIENCE: str = os.getenv("JWT_AUDIENCE", "authenticated")
+    # Access tokens are verified locally; set to true to also ask Supabase Auth on every request
+    AUTH_REMOTE_VERIFY: bool = os.getenv("AUTH_REMOTE_VERIFY", "false").lower() == "true"
+    AUTH_JWKS_TTL: float = float(os.getenv("AUTH_JWKS_TTL", "600"))
+    AUTH_JWKS_MIN_REFRESH: float = float(os.getenv("AUTH_JWKS_MIN_REFRESH", "30"))
+    AUTH_JWKS_TIMEOUT: float = float(os.getenv("AUTH_JWKS_TIMEOUT", "5"))
     CORS_ORIGINS: list = ["http://localhost:3000"]
+    # Supabase query pool and timeout (seconds)
+    SUPABASE_MAX_WORKERS: int = int(os.getenv("SUPABASE_MAX_WORKERS", "64"))
+    SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+    # OpenAI client pool and timeouts (seconds)
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "500"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "100"))
+    OPENAI_CONNECT_TIMEOUT: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "120"))
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    # Per-session conversation history cache (per worker)
+    HISTORY_CACHE_MAX_SESSIONS: int = int(os.getenv("HISTORY_CACHE_MAX_SESSIONS", "2000"))
+    HISTORY_CACHE_MAX_CHARS: int = int(os.getenv("HISTORY_CACHE_MAX_CHARS", "50000000"))
+    HISTORY_CACHE_TTL: float = float(os.getenv("HISTORY_CACHE_TTL", "900"))
+    # Optional cap on prompt tokens per turn, below the model's own window (0 = no cap)
+    CONTEXT_MAX_PROMPT_TOKENS: int = int(os.getenv("CONTEXT_MAX_PROMPT_TOKENS", "0"))
+    # Model routing: per-worker latency/error tracking, hedged requests and fallback models
+    ROUTING_WINDOW: float = float(os.getenv("ROUTING_WINDOW", "300"))
+    ROUTING_MIN_SAMPLES: int = int(os.getenv("ROUTING_MIN_SAMPLES", "20"))
+    ROUTING_HEDGE_ENABLED: bool = os.getenv("ROUTING_HEDGE_ENABLED", "false").lower() == "true"
+    ROUTING_HEDGE_PERCENTILE: float = float(os.getenv("ROUTING_HEDGE_PERCENTILE", "95"))
+    ROUTING_HEDGE_MIN_DELAY: float = float(os.getenv("ROUTING_HEDGE_MIN_DELAY", "1"))
+    ROUTING_ERROR_RATE: float = float(os.getenv("ROUTING_ERROR_RATE", "0.5"))
+    ROUTING_LATENCY_LIMIT: float = float(os.getenv("ROUTING_LATENCY_LIMIT", "0"))
+    # Comma-separated model:fallback pairs, e.g. "gpt-4:gpt-4-turbo,gpt-4-turbo:gpt-4"
+    MODEL_FALLBACKS: str = os.getenv("MODEL_FALLBACKS", "")
+    # Rolling summary of older turns for long sessions (needs the chat_session_summaries migration)
+    SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "false").lower() == "true"
+    SUMMARY_TRIGGER_TOKENS: int = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "4000"))
+    SUMMARY_KEEP_MESSAGES: int = int(os.getenv("SUMMARY_KEEP_MESSAGES", "6"))
+    SUMMARY_MODEL: str = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+    SUMMARY_MAX_TOKENS: int = int(os.getenv("SUMMARY_MAX_TOKENS", "512"))
+    # One turn at a time per chat session (queue shared through Redis when
+    # CACHE_BACKEND=redis): seconds a turn may wait, and the Redis lease that
+    # lets the queue move past a crashed worker
+    SESSION_LOCK_ENABLED: bool = os.getenv("SESSION_LOCK_ENABLED", "false").lower() == "true"
+    SESSION_LOCK_TIMEOUT: float = float(os.getenv("SESSION_LOCK_TIMEOUT", "60"))
+    SESSION_LOCK_LEASE: float = float(os.getenv("SESSION_LOCK_LEASE", "15"))
+    # POST /chat/batch: items per request, completions in flight per batch (also
+    # capped by RATE_LIMIT_MAX_CONCURRENT), turns per record_chat_turns call and
+    # how long an item may wait on rate limits before it is reported as a 429
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    BATCH_PERSIST_SIZE: int = int(os.getenv("BATCH_PERSIST_SIZE", "50"))
+    BATCH_RATE_LIMIT_WAIT: float = float(os.getenv("BATCH_RATE_LIMIT_WAIT", "60"))
+    # Chat WebSocket: seconds to wait for the auth message, idle time before a
+    # heartbeat ping (a second silent interval closes), and a stalled-send limit
+    WS_AUTH_TIMEOUT: float = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+    WS_HEARTBEAT_INTERVAL: float = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+    # orjson responses for large chat/users payloads, compressed (brotli if installed,
+    # else gzip) when the body reaches RESPONSE_COMPRESSION_MIN_SIZE bytes
+    RESPONSE_COMPRESSION_ENABLED: bool = os.getenv("RESPONSE_COMPRESSION_ENABLED", "false").lower() == "true"
+    RESPONSE_COMPRESSION_MIN_SIZE: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "4096"))
+    RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+    RESPONSE_BROTLI_QUALITY: int = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+    # Read-through cache (per worker) behind the ETags of GET /api/profiles/me and
+    # GET /chat/sessions; writes on this worker invalidate it, others' show after the TTL
+    RESPONSE_CACHE_ENABLED: bool = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_TTL: float = float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+    # Chat history export/import page and batch sizes (rows per Supabase round trip)
+    EXPORT_SESSION_PAGE_SIZE: int = int(os.getenv("EXPORT_SESSION_PAGE_SIZE", "100"))
+    EXPORT_MESSAGE_PAGE_SIZE: int = int(os.getenv("EXPORT_MESSAGE_PAGE_SIZE", "1000"))
+    IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+    # Shared cache backend for caches that support it: "memory" (per worker) or "redis"
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Opt-in cache of completions keyed on model, sampling params and messages
+    COMPLETION_CACHE_ENABLED: bool = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() == "true"
+    COMPLETION_CACHE_TTL: float = float(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+    COMPLETION_CACHE_MAX_ENTRIES: int = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "5000"))
+    # Idempotency-Key replay window (seconds) for chat sends
+    IDEMPOTENCY_TTL: float = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+    # Opt-in per-client chat limits (user id, or client IP when anonymous); 0 disables a limit.
+    # Each completion reserves its worst case (prompt + a full 1024-token reply) against
+    # the token and cost budgets until it settles: about $0.28 for a full gpt-4 context
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+    RATE_LIMIT_RPS: float = float(os.getenv("RATE_LIMIT_RPS", "1"))
+    RATE_LIMIT_BURST: float = float(os.getenv("RATE_LIMIT_BURST", "5"))
+    RATE_LIMIT_MAX_CONCURRENT: int = int(os.getenv("RATE_LIMIT_MAX_CONCURRENT", "3"))
+    RATE_LIMIT_TOKENS_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "40000"))
+    RATE_LIMIT_COST_PER_DAY: float = float(os.getenv("RATE_LIMIT_COST_PER_DAY", "5"))
 
-settings = Settings() 
\ No newline at end of file
+settings = Settings()
@@ -1,15 +1,39 @@
-from fastapi import FastAPI, HTTPException, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, init_supabase_client, close_supabase_client, run_query, run_sync
+from app.services.openai_client import init_openai_client, close_openai_client
+from app.services.conversation_summary import conversation_summarizer
+from app.services.context_builder import load_encodings
+from app.services.metrics import render_metrics, METRICS_CONTENT_TYPE
+from app.middleware.metrics import MetricsMiddleware
 from app.routers import users, auth, profiles  # Import profiles router
 from app.routers import chat  # Import chat router
+import asyncio
 import os
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 print("OPENAI_API_KEY:", os.environ.get("OPENAI_API_KEY"))
 
-app = FastAPI(title="Circuits Backend API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared clients are created once per worker and reused by every request
+    try:
+        init_supabase_client()
+    except ValueError:
+        # Missing configuration is already logged; Supabase routes will report it per request
+        pass
+    init_openai_client()
+    # Token counts use a length estimate until the tokenizers are loaded
+    encodings = asyncio.create_task(load_encodings())
+    yield
+    encodings.cancel()
+    await conversation_summarizer.close()
+    await close_openai_client()
+    close_supabase_client()
+
+app = FastAPI(title="Circuits Backend API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS for Next.js frontend
 app.add_middleware(
@@ -23,8 +47,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed", "Content-Disposition"],
 )
 
+# Outermost, so latency includes CORS handling and errors are counted
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(users.router)
 app.include_router(auth.router)
@@ -40,14 +68,18 @@ async def health_check():
         "python_version": "3.11"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/test-supabase")
 async def test_supabase_connection():
     try:
         supabase = get_supabase_client()
         # Test 1: Simple connection test
-        response = supabase.table('profiles').select('id').limit(1).execute()
+        response = await run_query(supabase.table('profiles').select('id').limit(1))
         # Test 2: Check if we can access auth users (admin operation)
-        auth_response = supabase.auth.admin.list_users()
+        auth_response = await run_sync(supabase.auth.admin.list_users)
         return {
             "status": "success",
             "message": "Supabase connection working",
@@ -1,35 +1,74 @@
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional
-from app.services.supabase_client import get_supabase_client
+from app.config import settings
+from app.models.schemas import AuthUser
+from app.services.supabase_client import get_supabase_client, run_sync
+from app.services.jwt_service import decode_access_token, LocalVerificationUnavailable
 import jwt
 import logging
 
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+async def _get_remote_user(token: str):
+    """Verify token with Supabase Auth (one network round trip)"""
+    supabase = get_supabase_client()
+    response = await run_sync(supabase.auth.get_user, token)
+    if not response.user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return response.user
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Extract and validate user from Supabase JWT token"""
     try:
         token = credentials.credentials
-        supabase = get_supabase_client()
-        # Verify token with Supabase
-        response = supabase.auth.get_user(token)
-        if not response.user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return response.user
+        if settings.AUTH_REMOTE_VERIFY:
+            return await _get_remote_user(token)
+        try:
+            claims = await decode_access_token(token)
+        except LocalVerificationUnavailable:
+            return await _get_remote_user(token)
+        return AuthUser(
+            id=claims["sub"],
+            email=claims.get("email"),
+            phone=claims.get("phone"),
+            role=claims.get("role"),
+            aud=claims.get("aud"),
+            app_metadata=claims.get("app_metadata") or {},
+            user_metadata=claims.get("user_metadata") or {},
+            is_anonymous=claims.get("is_anonymous", False)
+        )
+    except jwt.PyJWTError as e:
+        logger.warning(f"Token validation error: {e}")
+        raise _credentials_exception()
     except Exception as e:
         logger.error(f"Token validation error: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credentials_exception()
+
+async def get_current_user_remote(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Validate token with Supabase Auth so revoked sessions are rejected.
+
+    Use for revocation-sensitive routes; everything else should use
+    get_current_user, which verifies the token locally.
+    """
+    try:
+        return await _get_remote_user(credentials.credentials)
+    except Exception as e:
+        logger.error(f"Token validation error: {e}")
+        raise _credentials_exception()
 
 def require_auth(user: dict = Depends(get_current_user)) -> dict:
     """Dependency to require authentication"""
-    return user 
\ No newline at end of file
+    return user
@@ -0,0 +1,41 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.services.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT
+import time
+
+# Pre-built status labels so recording a request does no string formatting
+_STATUS_LABELS = {code: str(code) for code in range(100, 600)}
+
+class MetricsMiddleware:
+    """Record per-route latency and in-flight requests.
+
+    Plain ASGI rather than BaseHTTPMiddleware to keep per-request overhead low
+    and leave streaming responses untouched. Routes are labelled by their
+    template (e.g. /chat/sessions/{session_id}); unmatched paths share one label.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                _STATUS_LABELS.get(status[0], "other")
+            ).observe(time.perf_counter() - start)
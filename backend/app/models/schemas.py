@@ -24,6 +24,17 @@ class UserResponse(BaseModel):
     count: int
 
 # Authentication models
+class AuthUser(BaseModel):
+    """Authenticated user built from verified access token claims"""
+    id: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    role: Optional[str] = None
+    aud: Optional[str] = None
+    app_metadata: Dict[str, Any] = {}
+    user_metadata: Dict[str, Any] = {}
+    is_anonymous: bool = False
+
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str
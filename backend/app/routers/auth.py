@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Response, Request
 from app.models.schemas import LoginRequest, SignupRequest, AuthResponse, TokenResponse, PasswordUpdateRequest, ForgotPasswordRequest, ResetPasswordRequest
 from app.services.auth_service import authenticate_user, create_user, refresh_token, update_password, forgot_password, reset_password
-from app.middleware.auth import get_current_user
+from app.middleware.auth import get_current_user, get_current_user_remote
 from typing import Dict, Any
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
@@ -106,7 +106,7 @@ async def logout(response: Response):
 @router.put("/password")
 async def change_password(
     data: PasswordUpdateRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_remote)
 ):
     """Update password for authenticated user"""
     try:
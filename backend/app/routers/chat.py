@@ -1,20 +1,53 @@
-from fastapi import APIRouter, HTTPException, status, Depends, Request, Security, Response
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Security, Response, Query, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field, constr
-from typing import Optional, List, Dict, Any, Annotated
-from datetime import datetime
-import os
-import openai
+from pydantic import BaseModel, Field, ValidationError, constr
+from postgrest.exceptions import APIError
+from typing import Optional, List, Dict, Any, Annotated, Awaitable, Callable, Literal, Set, Tuple, AsyncIterator
+from datetime import datetime, timedelta, timezone
+import asyncio
+import hashlib
+import html
+import json
+import jwt
+import logging
 import re
-from app.services.supabase_client import get_supabase_client
+import time
+from app.services.supabase_client import get_supabase_client, run_query
+from app.config import settings
+from app.services.model_router import model_router
+from app.services.history_cache import history_cache
+from app.services.completion_cache import completion_cache, completion_cache_key
+from app.services.request_dedup import chat_single_flight, idempotency_store
+from app.services.rate_limit import rate_limiter, RateLimitExceeded, CompletionLease, retry_after_header
+from app.services.metrics import OPENAI_REQUEST_DURATION, OPENAI_TIME_TO_FIRST_TOKEN, record_usage
+from app.services.pagination import keyset_page, finish_page, encode_cursor, decode_cursor
+from app.services.json_response import encode_json, fast_json_response, trusted_row, trusted_rows
+from app.services.response_cache import session_list_cache, session_owner, CachedResponse, conditional_response, weak_etag
+from app.services.group_commit import GroupCommit
+from app.services.cache_backends import MemoryCacheBackend
+from app.services.session_turns import session_turns, SessionBusy, SessionTurn
+from app.services.chat_export import export_chat_history, gzip_stream, read_ndjson, ChatImporter
+from app.services.context_builder import build_context, count_tokens, ContextTooLargeError
+from app.services.conversation_summary import conversation_summarizer, session_summary, apply_summary, SUMMARY_COLUMNS
 from app.middleware.auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 # --- Utility Functions and Constants ---
 MODEL_COSTS = {
     "gpt-3.5-turbo": {"input": 0.0005, "output": 0.0015},  # per 1K tokens
     "gpt-4": {"input": 0.03, "output": 0.06},
     "gpt-4-turbo": {"input": 0.01, "output": 0.03},
 }
+MAX_COMPLETION_TOKENS = 1024
+COMPLETION_TEMPERATURE = 0.7
+# Caller/session pairs remembered as owned, and for how long (seconds)
+SESSION_OWNER_CACHE_SIZE = 10000
+SESSION_OWNER_TTL = 3600
+# Longest date range served per usage granularity
+USAGE_MAX_RANGE = {"hour": timedelta(days=31), "day": timedelta(days=1096)}
 
 def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
     cost_info = MODEL_COSTS.get(model, MODEL_COSTS["gpt-3.5-turbo"])
@@ -23,9 +56,8 @@ def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
         (output_tokens / 1000) * cost_info["output"]
     )
 
-def estimate_tokens(text: str) -> int:
-    # Simple token estimation: 1 token ≈ 4 chars (for English)
-    return max(1, len(text) // 4)
+def estimate_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    return max(1, count_tokens(text, model))
 
 # --- Pydantic Models ---
 class ChatSessionCreate(BaseModel):
@@ -40,6 +72,11 @@ class ChatRequest(BaseModel):
     message: str
     session_id: str
     model: Annotated[str, constr(pattern=r"^gpt-(3\.5-turbo|4|4-turbo)$")]
+    cache: bool = True  # Allow a cached completion when the completion cache is enabled
+
+class BatchChatRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)  # Capped at BATCH_CONCURRENCY
 
 class ChatResponse(BaseModel):
     session_id: str
@@ -47,6 +84,10 @@ class ChatResponse(BaseModel):
     content: str
     tokens: int
     cost: float
+    prompt_tokens: Optional[int] = None
+    model: Optional[str] = None  # Model that produced the reply; differs from the session's after a fallback
+    saved_tokens: int = 0  # Prompt tokens the conversation summary saved on this turn
+    cached: bool = False
 
 class ChatSession(BaseModel):
     id: str
@@ -67,10 +108,32 @@ class ChatMessage(BaseModel):
     created_at: datetime
     tokens: int
     cost: float
+    model: Optional[str] = None
+    saved_tokens: int = 0
+    saved_cost: float = 0.0
 
 class ChatSessionWithMessages(ChatSession):
     messages: List[ChatMessage] = []
 
+class UsageBucket(BaseModel):
+    bucket: datetime
+    model: str
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+    cost: float
+    requests: int
+
+class UsageReport(BaseModel):
+    granularity: str
+    start: datetime
+    end: datetime
+    buckets: List[UsageBucket]
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+    cost: float
+
 # --- Authentication Dependency ---
 security = HTTPBearer()
 
@@ -105,9 +168,10 @@ async def create_session(
         "total_cost": 0.0
     }
     try:
-        response = supabase.table("chat_sessions").insert(session_data).execute()
+        response = await run_query(supabase.table("chat_sessions").insert(session_data))
         if response.data and len(response.data) > 0:
             session = response.data[0]
+            await session_list_cache.invalidate([session_owner(user_id)])
             return ChatSession(**session)
         else:
             raise HTTPException(status_code=500, detail="Failed to create chat session")
@@ -117,20 +181,39 @@ async def create_session(
 @router.get("/sessions", response_model=List[ChatSession])
 async def get_sessions(
     request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = Query(None, description="Cursor for older sessions"),
+    after: Optional[str] = Query(None, description="Cursor for newer sessions"),
     user: Optional[dict] = Depends(get_optional_current_user)
 ):
+    """List sessions newest first, paginated on (updated_at, id).
+
+    When more sessions exist, X-Next-Cursor holds the cursor to pass back as
+    the same before/after parameter. Pages carry a weak ETag and are answered
+    from session_list_cache for RESPONSE_CACHE_TTL, so a poll with a matching
+    If-None-Match usually ends in a 304 without a database query.
+    """
     supabase = get_supabase_client()
+    owner = session_owner(user.id if user else None)
+    variant = f"{limit}:{before}:{after}"
     try:
-        query = supabase.table("chat_sessions").select("*").order("updated_at", desc=True)
-        if user:
-            query = query.eq("user_id", user.id)
-        else:
-            query = query.is_("user_id", None)
-        response = query.execute()
-        if response.data:
-            return [ChatSession(**s) for s in response.data]
-        else:
-            return []
+        cached = await session_list_cache.get(owner, variant)
+        if cached is None:
+            query = _owned_by(supabase.table("chat_sessions").select("*"), user)
+            query = keyset_page(query, "updated_at", limit, before, after)
+            result = await run_query(query)
+            sessions, next_cursor = finish_page(result.data or [], "updated_at", limit, after)
+            # total_tokens too: summary billing changes it without touching updated_at
+            etag = weak_etag(variant, next_cursor, *(f"{s['id']}@{s['updated_at']}/{s['total_tokens']}" for s in sessions))
+            cached = CachedResponse(
+                encode_json(trusted_rows(sessions, ChatSession)),
+                etag,
+                {"X-Next-Cursor": next_cursor} if next_cursor else {}
+            )
+            await session_list_cache.set(owner, cached, variant)
+        return conditional_response(request, cached)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching chat sessions: {e}")
 
@@ -138,8 +221,16 @@ async def get_sessions(
 async def get_session(
     session_id: str,
     request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = Query(None, description="Cursor for older messages"),
+    after: Optional[str] = Query(None, description="Cursor for newer messages"),
     user: Optional[dict] = Depends(get_optional_current_user)
 ):
+    """Get a session with its latest messages, oldest first, paginated on (created_at, id).
+
+    When more messages exist, X-Next-Cursor holds the cursor to pass back as
+    the same before/after parameter.
+    """
     supabase = get_supabase_client()
     try:
         # Fetch session
@@ -148,107 +239,917 @@ async def get_session(
             session_query = session_query.eq("user_id", user.id)
         else:
             session_query = session_query.is_("user_id", None)
-        session_resp = session_query.single().execute()
+        # Fetch messages alongside; they are only returned if the session check passes
+        messages_query = keyset_page(
+            supabase.table("chat_messages").select("*").eq("session_id", session_id),
+            "created_at", limit, before, after
+        )
+        # limit(1): a missing or foreign session is an empty list (404), not a PostgREST error
+        session_resp, messages_resp = await asyncio.gather(
+            run_query(session_query.limit(1)),
+            run_query(messages_query)
+        )
         if not session_resp.data:
             raise HTTPException(status_code=404, detail="Session not found")
-        session = session_resp.data
-        # Fetch messages
-        messages_query = supabase.table("chat_messages").select("*").eq("session_id", session_id).order("created_at")
-        messages_resp = messages_query.execute()
-        messages = [ChatMessage(**m) for m in messages_resp.data] if messages_resp.data else []
-        return ChatSessionWithMessages(**session, messages=messages)
+        session = session_resp.data[0]
+        rows, next_cursor = finish_page(messages_resp.data or [], "created_at", limit, after)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        # Rows come from our own tables, so they are shaped, not re-validated
+        body = trusted_row(session, ChatSession)
+        body["messages"] = trusted_rows(reversed(rows), ChatMessage)
+        return fast_json_response(request, body, headers=headers)
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching session: {e}")
 
+# --- Message Pipeline Helpers ---
+def _owned_by(query, user: Optional[dict]):
+    """Restrict a chat_sessions query, read or write, to the caller's sessions"""
+    if user:
+        return query.eq("user_id", user.id)
+    return query.is_("user_id", None)
+
+async def _get_owned_session(supabase, session_id: str, user: Optional[dict]) -> Dict[str, Any]:
+    # The conversation summary rides along with the session row
+    columns = SUMMARY_COLUMNS if settings.SUMMARY_ENABLED else "*"
+    session_query = _owned_by(supabase.table("chat_sessions").select(columns).eq("id", session_id), user)
+    # limit(1) rather than single(): no match is an empty list, not an error response
+    session_resp = await run_query(session_query.limit(1))
+    if not session_resp.data:
+        raise HTTPException(status_code=404, detail="Session not found or access denied")
+    return session_resp.data[0]
+
+# Sessions each caller was already seen to own, so their later turns queue without
+# the extra read. Sessions never change owner, and the read under the turn still checks
+_verified_owners = MemoryCacheBackend(SESSION_OWNER_CACHE_SIZE)
+
+async def _check_session_owner(supabase, session_id: str, user: Optional[dict]) -> None:
+    """404 unless the caller owns the session; run before queueing for its turn.
+
+    Turns queue per session, so leaving the check to the read under the turn
+    would let anyone holding a session id delay its owner's turns.
+    """
+    key = f"{session_owner(user.id if user else None)}:{session_id}"
+    if await _verified_owners.get(key):
+        return
+    query = _owned_by(supabase.table("chat_sessions").select("id").eq("id", session_id), user)
+    if not (await run_query(query.limit(1))).data:
+        raise HTTPException(status_code=404, detail="Session not found or access denied")
+    await _verified_owners.set(key, True, SESSION_OWNER_TTL)
+
+async def _prepare_turn(
+    supabase,
+    session: Dict[str, Any],
+    data: ChatRequest
+) -> Tuple[List[Dict[str, str]], int, int]:
+    """Build the OpenAI message list for this turn.
+
+    Returns the messages trimmed to the model's prompt budget, their token
+    count, and the prompt tokens saved by sending the session's summary in
+    place of the turns it covers.
+    """
+    session_id = session["id"]
+    # Conversation history comes from the cache while the session row is unchanged
+    history = history_cache.get(session_id, session["updated_at"])
+    if history is None:
+        messages_resp = await run_query(supabase.table("chat_messages").select("role", "content").eq("session_id", session_id).order("created_at"))
+        history = [
+            {"role": m["role"], "content": m["content"]}
+            for m in (messages_resp.data or [])
+        ]
+        history_cache.set(session_id, history, session["updated_at"])
+    new_message = {"role": "user", "content": data.message}
+    try:
+        full_messages, full_tokens = build_context(history + [new_message], session["model"], MAX_COMPLETION_TOKENS)
+    except ContextTooLargeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not settings.SUMMARY_ENABLED:
+        return full_messages, full_tokens, 0
+    summary = session_summary(session)
+    compacted, covered = apply_summary(history, summary)
+    conversation_summarizer.maybe_refresh(session, history, summary, covered, calculate_cost)
+    if not covered:
+        return full_messages, full_tokens, 0
+    try:
+        openai_messages, prompt_tokens = build_context(compacted + [new_message], session["model"], MAX_COMPLETION_TOKENS)
+    except ContextTooLargeError:
+        return full_messages, full_tokens, 0
+    if prompt_tokens >= full_tokens:
+        return full_messages, full_tokens, 0
+    return openai_messages, prompt_tokens, full_tokens - prompt_tokens
+
+def _turn_params(
+    session: Dict[str, Any],
+    data: ChatRequest,
+    user: Optional[dict],
+    ai_content: str,
+    input_tokens: int,
+    output_tokens: int,
+    saved_tokens: int = 0,
+    model: Optional[str] = None
+) -> Dict[str, Any]:
+    """record_chat_turn arguments for one turn, billed at the rates of ``model``"""
+    model = model or session["model"]
+    params = {
+        "p_session_id": session["id"],
+        "p_user_id": user.id if user else None,
+        "p_user_content": data.message,
+        "p_user_tokens": estimate_tokens(data.message, session["model"]),
+        "p_assistant_content": ai_content,
+        "p_input_tokens": input_tokens,
+        "p_output_tokens": output_tokens,
+        "p_cost": calculate_cost(model, input_tokens, output_tokens),
+        "p_model": model
+    }
+    if saved_tokens:
+        params["p_saved_tokens"] = saved_tokens
+        params["p_saved_cost"] = calculate_cost(session["model"], saved_tokens, 0)
+    return params
+
+async def _apply_turn(session: Dict[str, Any], params: Dict[str, Any], turn: Dict[str, Any]) -> Dict[str, Any]:
+    """Bring caches, metrics and the caller's session copy up to date with a recorded turn"""
+    session_id = session["id"]
+    model = params["p_model"]
+    base_version = session["updated_at"]
+    # Keep the caller's copy current for callers that reuse it across turns (WebSocket)
+    session.update(updated_at=turn["updated_at"], total_tokens=turn["total_tokens"], total_cost=turn["total_cost"])
+    await session_list_cache.invalidate([session_owner(session["user_id"])])
+    record_usage(model, params["p_input_tokens"], params["p_output_tokens"], params["p_cost"])
+    history_cache.append(
+        session_id,
+        [{"role": "user", "content": params["p_user_content"]}, {"role": "assistant", "content": params["p_assistant_content"]}],
+        base_version,
+        turn["updated_at"]
+    )
+    return {
+        "message_id": turn["assistant_message_id"],
+        "tokens": params["p_output_tokens"],
+        "cost": params["p_cost"],
+        "model": model,
+        "saved_tokens": params.get("p_saved_tokens", 0)
+    }
+
+async def _persist_turn(
+    supabase,
+    session: Dict[str, Any],
+    data: ChatRequest,
+    user: Optional[dict],
+    ai_content: str,
+    input_tokens: int,
+    output_tokens: int,
+    saved_tokens: int = 0,
+    model: Optional[str] = None
+) -> Dict[str, Any]:
+    """Save both messages of a turn and add its usage to the session totals.
+
+    One RPC to record_chat_turn (supabase/migrations) does the inserts and an
+    atomic increment of total_tokens/total_cost in a single transaction.
+    Usage is billed at the rates of ``model``, the model that actually
+    answered, which defaults to the session's.
+    """
+    params = _turn_params(session, data, user, ai_content, input_tokens, output_tokens, saved_tokens, model)
+    try:
+        turn_resp = await run_query(supabase.rpc("record_chat_turn", params))
+    except APIError as e:
+        # The function only touches the session if the caller still owns it
+        if e.code != "P0002":
+            raise
+        history_cache.invalidate(session["id"])
+        raise HTTPException(status_code=404, detail="Session not found or access denied")
+    if not turn_resp.data:
+        history_cache.invalidate(session["id"])
+        raise HTTPException(status_code=500, detail="Failed to save chat messages")
+    return await _apply_turn(session, params, turn_resp.data)
+
+async def _record_turns(supabase, entries: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Any]:
+    """Save several turns in one record_chat_turns call; group_commit flush for batches.
+
+    ``entries`` are (session, record_chat_turn params) pairs. Returns one
+    result per entry: what _persist_turn would return, or the HTTPException
+    it would raise, so one failed turn does not fail the others.
+    """
+    resp = await run_query(supabase.rpc("record_chat_turns", {"p_turns": [params for _, params in entries]}))
+    outcomes = resp.data or []
+    if len(outcomes) != len(entries):
+        raise RuntimeError("record_chat_turns returned an unexpected number of results")
+    results: List[Any] = []
+    for (session, params), outcome in zip(entries, outcomes):
+        if outcome.get("turn"):
+            results.append(await _apply_turn(session, params, outcome["turn"]))
+            continue
+        history_cache.invalidate(session["id"])
+        if outcome.get("error") == "P0002":
+            results.append(HTTPException(status_code=404, detail="Session not found or access denied"))
+        else:
+            results.append(HTTPException(status_code=500, detail=f"Error saving message: {outcome.get('message')}"))
+    return results
+
+def _completion_cache_key(data: ChatRequest, model: str, openai_messages: List[Dict[str, str]]) -> Optional[str]:
+    if not (settings.COMPLETION_CACHE_ENABLED and data.cache):
+        return None
+    return completion_cache_key(
+        model,
+        openai_messages,
+        max_tokens=MAX_COMPLETION_TOKENS,
+        temperature=COMPLETION_TEMPERATURE
+    )
+
+def _rate_limit_key(request: Request, user: Optional[dict]) -> str:
+    if user:
+        return f"user:{user.id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+async def enforce_chat_rate_limit(
+    request: Request,
+    user: Optional[dict] = Depends(get_optional_current_user)
+) -> None:
+    """Per-client request rate limit for the chat send endpoints"""
+    try:
+        await rate_limiter.check_request(_rate_limit_key(request, user))
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=e.detail, headers=retry_after_header(e.retry_after))
+
+async def _acquire_completion_lease(limit_key: str, model: str, prompt_tokens: int) -> CompletionLease:
+    """Reserve a completion slot, pricing the worst case of a full MAX_COMPLETION_TOKENS reply"""
+    try:
+        return await rate_limiter.acquire_completion(
+            limit_key,
+            prompt_tokens + MAX_COMPLETION_TOKENS,
+            calculate_cost(model, prompt_tokens, MAX_COMPLETION_TOKENS)
+        )
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=e.detail, headers=retry_after_header(e.retry_after))
+
+def _session_busy(e: SessionBusy) -> HTTPException:
+    return HTTPException(status_code=409, detail=e.detail, headers=retry_after_header(e.retry_after))
+
+def _sse_event(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+# Saves of abandoned streams, referenced until done so they are not garbage collected
+_abandoned_saves: Set[asyncio.Task] = set()
+
+async def _persist_abandoned_turn(
+    supabase,
+    session: Dict[str, Any],
+    data: ChatRequest,
+    user: Optional[dict],
+    ai_content: str,
+    input_tokens: int,
+    output_tokens: int,
+    saved_tokens: int,
+    model: str,
+    stream,
+    lease: Optional[CompletionLease],
+    held: Optional[SessionTurn]
+) -> None:
+    """Close, bill and save a streamed turn whose client went away.
+
+    ``held`` is released once the turn is saved, so the session's next turn
+    sees it.
+    """
+    try:
+        try:
+            if stream is not None:
+                await stream.aclose()
+        except Exception as e:
+            logger.warning(f"Closing an abandoned completion stream failed: {e}")
+        if lease:
+            await lease.settle(input_tokens + output_tokens, calculate_cost(model, input_tokens, output_tokens))
+            await lease.release()
+        if not ai_content:
+            return
+        try:
+            await _persist_turn(supabase, session, data, user, ai_content, input_tokens, output_tokens, saved_tokens, model)
+        except Exception as e:
+            logger.warning(f"Saving the abandoned turn on session {session['id']} failed: {e}")
+    finally:
+        if held:
+            await held.release()
+
+async def _save_abandoned_turn(save) -> None:
+    """Run _persist_abandoned_turn shielded from the cancellation that ended the stream"""
+    task = asyncio.ensure_future(save)
+    _abandoned_saves.add(task)
+    task.add_done_callback(_abandoned_saves.discard)
+    await asyncio.shield(task)
+
+async def _stream_turn(
+    supabase,
+    session: Dict[str, Any],
+    data: ChatRequest,
+    user: Optional[dict],
+    openai_messages: List[Dict[str, str]],
+    prompt_tokens: int,
+    saved_tokens: int,
+    cache_key: Optional[str],
+    cached: Optional[Dict[str, Any]],
+    lease: Optional[CompletionLease],
+    held: Optional[SessionTurn] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run one streamed chat turn, yielding its events as dicts.
+
+    Emits ``start`` with the prompt size, ``delta`` events as tokens arrive,
+    then a single ``done`` carrying the same fields as ``ChatResponse`` once
+    the reply is persisted, or an ``error`` if the completion or the save
+    fails. Shared by the SSE endpoint and the WebSocket channel; ``lease`` is
+    released here for a completion, and must be None for a cached reply.
+    If the consumer goes away mid-stream, the reply so far is still billed
+    against the lease and saved, and the session's turn ``held`` by the
+    caller passes to that save.
+    """
+    if cached:
+        yield {"type": "start", "session_id": session["id"], "prompt_tokens": prompt_tokens}
+        try:
+            yield {"type": "delta", "content": cached["content"]}
+        except BaseException:
+            await _save_abandoned_turn(_persist_abandoned_turn(
+                supabase, session, data, user, cached["content"], 0, 0, 0, session["model"], None, None,
+                held.handoff() if held else None
+            ))
+            raise
+        try:
+            saved = await _persist_turn(supabase, session, data, user, cached["content"], 0, 0)
+        except HTTPException as e:
+            yield {"type": "error", "detail": e.detail}
+            return
+        except Exception as e:
+            yield {"type": "error", "detail": f"Error saving message: {e}"}
+            return
+        yield {"type": "done", "session_id": session["id"], "prompt_tokens": prompt_tokens, "cached": True, **saved}
+        return
+
+    chunks: List[str] = []
+    input_tokens = output_tokens = 0
+    yield {"type": "start", "session_id": session["id"], "prompt_tokens": prompt_tokens}
+    model = session["model"]
+    stream = None
+    started = time.perf_counter()
+    try:
+        stream, model = await model_router.stream(
+            session["model"],
+            messages=openai_messages,
+            max_tokens=MAX_COMPLETION_TOKENS,
+            temperature=COMPLETION_TEMPERATURE,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            # The final chunk carries usage and no choices
+            if chunk.usage:
+                input_tokens = chunk.usage.prompt_tokens
+                output_tokens = chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                delta = chunk.choices[0].delta.content
+                if not chunks:
+                    OPENAI_TIME_TO_FIRST_TOKEN.labels(model).observe(time.perf_counter() - started)
+                chunks.append(delta)
+                yield {"type": "delta", "content": delta}
+        OPENAI_REQUEST_DURATION.labels(model, "ok").observe(time.perf_counter() - started)
+        if not output_tokens:
+            input_tokens = prompt_tokens
+            output_tokens = estimate_tokens("".join(chunks), model)
+        await lease.settle(input_tokens + output_tokens, calculate_cost(model, input_tokens, output_tokens))
+    except Exception as e:
+        OPENAI_REQUEST_DURATION.labels(model, "error").observe(time.perf_counter() - started)
+        yield {"type": "error", "detail": f"OpenAI error: {e}"}
+        return
+    except BaseException:
+        # The client went away mid-stream: the generator was closed at a yield
+        # or its task cancelled. What was streamed is paid for upstream, so it
+        # is billed and saved in a task the close cannot interrupt
+        if stream is not None:
+            if not output_tokens:
+                input_tokens = prompt_tokens
+                output_tokens = estimate_tokens("".join(chunks), model)
+            abandoned = _persist_abandoned_turn(
+                supabase, session, data, user, "".join(chunks),
+                input_tokens, output_tokens, saved_tokens, model, stream, lease,
+                held.handoff() if held else None
+            )
+            stream = lease = None
+            await _save_abandoned_turn(abandoned)
+        raise
+    finally:
+        if stream is not None:
+            await stream.aclose()
+        if lease:
+            await lease.release()
+    ai_content = "".join(chunks)
+    if cache_key and model == session["model"]:
+        await completion_cache.set(
+            cache_key, ai_content, input_tokens, output_tokens,
+            calculate_cost(model, input_tokens, output_tokens)
+        )
+    try:
+        saved = await _persist_turn(supabase, session, data, user, ai_content, input_tokens, output_tokens, saved_tokens, model)
+    except HTTPException as e:
+        yield {"type": "error", "detail": e.detail}
+        return
+    except Exception as e:
+        yield {"type": "error", "detail": f"Error saving message: {e}"}
+        return
+    yield {"type": "done", "session_id": session["id"], "prompt_tokens": prompt_tokens, "cached": False, **saved}
+
+async def _complete_turn(
+    supabase,
+    session_id: str,
+    data: ChatRequest,
+    user: Optional[dict],
+    limit_key: str,
+    acquire_lease: Callable[[str, str, int], Awaitable[CompletionLease]] = _acquire_completion_lease
+) -> Dict[str, Any]:
+    """Context, completion cache and completion for one turn, without saving it.
+
+    Returns the session plus the reply and usage that _persist_turn records.
+    ``acquire_lease`` reserves the completion against the rate limits.
+    """
+    session = await _get_owned_session(supabase, session_id, user)
+    openai_messages, prompt_tokens, saved_tokens = await _prepare_turn(supabase, session, data)
+    cache_key = _completion_cache_key(data, session["model"], openai_messages)
+    cached = await completion_cache.get(cache_key) if cache_key else None
+    if cached:
+        # Nothing was spent upstream, so the reply is recorded at zero tokens and cost
+        return {
+            "session": session, "content": cached["content"], "model": session["model"], "prompt_tokens": prompt_tokens,
+            "input_tokens": 0, "output_tokens": 0, "saved_tokens": 0, "cached": True
+        }
+    lease = await acquire_lease(limit_key, session["model"], prompt_tokens)
+    # Call OpenAI, hedged and with fallback per the model router
+    try:
+        response, model = await model_router.complete(
+            session["model"],
+            messages=openai_messages,
+            max_tokens=MAX_COMPLETION_TOKENS,
+            temperature=COMPLETION_TEMPERATURE
+        )
+        ai_content = response.choices[0].message.content
+        usage = response.usage
+        input_tokens = usage.prompt_tokens
+        output_tokens = usage.completion_tokens
+        await lease.settle(input_tokens + output_tokens, calculate_cost(model, input_tokens, output_tokens))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
+    finally:
+        await lease.release()
+    # A fallback reply is not what the cache key's model would have produced
+    if cache_key and model == session["model"]:
+        await completion_cache.set(
+            cache_key, ai_content, input_tokens, output_tokens,
+            calculate_cost(model, input_tokens, output_tokens)
+        )
+    return {
+        "session": session, "content": ai_content, "model": model, "prompt_tokens": prompt_tokens,
+        "input_tokens": input_tokens, "output_tokens": output_tokens, "saved_tokens": saved_tokens, "cached": False
+    }
+
+def _chat_response(turn: Dict[str, Any], saved: Dict[str, Any]) -> ChatResponse:
+    return ChatResponse(
+        session_id=turn["session"]["id"],
+        message_id=saved["message_id"],
+        content=turn["content"],
+        tokens=saved["tokens"],
+        cost=saved["cost"],
+        prompt_tokens=turn["prompt_tokens"],
+        model=saved["model"],
+        saved_tokens=saved["saved_tokens"],
+        cached=turn["cached"]
+    )
+
+async def _run_turn(
+    supabase,
+    session_id: str,
+    data: ChatRequest,
+    user: Optional[dict],
+    limit_key: str
+) -> ChatResponse:
+    """Run one non-streaming chat turn end to end: context, completion, persistence.
+
+    Holds the session's turn from reading the history until the reply is saved.
+    """
+    try:
+        await _check_session_owner(supabase, session_id, user)
+        async with session_turns.turn(session_id):
+            turn = await _complete_turn(supabase, session_id, data, user, limit_key)
+            saved = await _persist_turn(
+                supabase, turn["session"], data, user, turn["content"],
+                turn["input_tokens"], turn["output_tokens"], turn["saved_tokens"], turn["model"]
+            )
+        return _chat_response(turn, saved)
+    except SessionBusy as e:
+        raise _session_busy(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error sending message: {e}")
+
+# Fingerprint of the send running under each Idempotency-Key in this process
+_idempotency_in_flight: Dict[str, str] = {}
+
 @router.post("/sessions/{session_id}/messages", response_model=ChatResponse)
 async def send_message(
     session_id: str,
     data: ChatRequest,
     request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
     user: Optional[dict] = Depends(get_optional_current_user)
 ):
+    """Send a message and return the assistant reply.
+
+    Identical concurrent sends to a session share one completion and one saved
+    turn. With an Idempotency-Key header, a retry within IDEMPOTENCY_TTL
+    replays the stored response instead of sending again; replays are not
+    rate limited.
+    """
     supabase = get_supabase_client()
-    try:
-        # Validate session access
-        session_query = supabase.table("chat_sessions").select("*").eq("id", session_id)
-        if user:
-            session_query = session_query.eq("user_id", user.id)
-        else:
-            session_query = session_query.is_("user_id", None)
-        session_resp = session_query.single().execute()
-        if not session_resp.data:
-            raise HTTPException(status_code=404, detail="Session not found or access denied")
-        session = session_resp.data
-        # Save user message
-        user_msg = {
-            "session_id": session_id,
-            "role": "user",
-            "content": data.message,
-            "tokens": estimate_tokens(data.message),
-            "cost": 0.0,  # Will update after OpenAI call
-            "user_id": user.id if user else None
-        }
-        user_msg_resp = supabase.table("chat_messages").insert(user_msg).execute()
-        if not user_msg_resp.data or len(user_msg_resp.data) == 0:
-            raise HTTPException(status_code=500, detail="Failed to save user message")
-        user_msg_id = user_msg_resp.data[0]["id"]
-        # Get conversation history (all messages for this session)
-        messages_resp = supabase.table("chat_messages").select("*").eq("session_id", session_id).order("created_at").execute()
-        messages = messages_resp.data if messages_resp.data else []
-        openai_messages = [
-            {"role": m["role"], "content": m["content"]}
-            for m in messages
-        ]
-        # Add the new user message to the context
-        openai_messages.append({"role": "user", "content": data.message})
-        # Call OpenAI
-        openai.api_key = os.environ["OPENAI_API_KEY"]
+    owner = user.id if user else "anonymous"
+    fingerprint = hashlib.sha256(f"{owner}\0{session_id}\0{data.message}".encode()).hexdigest()
+    if idempotency_key:
+        store_key = f"{owner}:{session_id}:{idempotency_key}"
         try:
-            response = openai.chat.completions.create(
-                model=session["model"],
-                messages=openai_messages,
-                max_tokens=1024,
-                temperature=0.7
-            )
-            ai_content = response.choices[0].message.content
-            usage = response.usage
-            input_tokens = usage.prompt_tokens
-            output_tokens = usage.completion_tokens
+            stored = await idempotency_store.get(store_key)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
-        # Save AI message
-        ai_msg = {
-            "session_id": session_id,
-            "role": "assistant",
-            "content": ai_content,
-            "tokens": output_tokens,
-            "cost": calculate_cost(session["model"], input_tokens, output_tokens),
-        }
-        ai_msg_resp = supabase.table("chat_messages").insert(ai_msg).execute()
-        if not ai_msg_resp.data or len(ai_msg_resp.data) == 0:
-            raise HTTPException(status_code=500, detail="Failed to save AI message")
-        ai_msg_id = ai_msg_resp.data[0]["id"]
-        # Update session totals
-        total_tokens = (session["total_tokens"] or 0) + input_tokens + output_tokens
-        total_cost = float(session["total_cost"] or 0) + calculate_cost(session["model"], input_tokens, output_tokens)
-        supabase.table("chat_sessions").update({
-            "total_tokens": total_tokens,
-            "total_cost": total_cost,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", session_id).execute()
-        return ChatResponse(
-            session_id=session_id,
-            message_id=ai_msg_id,
-            content=ai_content,
-            tokens=output_tokens,
-            cost=calculate_cost(session["model"], input_tokens, output_tokens)
-        )
+            logger.warning(f"Idempotency lookup failed: {e}")
+            stored = None
+        if stored:
+            if stored["fingerprint"] != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            response.headers["Idempotent-Replayed"] = "true"
+            return ChatResponse(**stored["response"])
+        if _idempotency_in_flight.get(store_key, fingerprint) != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key is in use by a different request")
+    # After the replay lookup, so a client retrying a stored send is not turned away
+    await enforce_chat_rate_limit(request, user)
+
+    async def run() -> ChatResponse:
+        if idempotency_key:
+            _idempotency_in_flight[store_key] = fingerprint
+        try:
+            result = await _run_turn(supabase, session_id, data, user, _rate_limit_key(request, user))
+            if idempotency_key:
+                try:
+                    await idempotency_store.set(
+                        store_key,
+                        {"fingerprint": fingerprint, "response": result.model_dump()},
+                        settings.IDEMPOTENCY_TTL
+                    )
+                except Exception as e:
+                    logger.warning(f"Idempotency store failed: {e}")
+            return result
+        finally:
+            if idempotency_key and _idempotency_in_flight.get(store_key) == fingerprint:
+                del _idempotency_in_flight[store_key]
+
+    # The fingerprint keeps a different body sent under the same key off this flight
+    flight_key = f"idem:{store_key}:{fingerprint}" if idempotency_key else fingerprint
+    return await chat_single_flight.do(flight_key, run)
+
+@router.post("/sessions/{session_id}/messages/stream", dependencies=[Depends(enforce_chat_rate_limit)])
+async def stream_message(
+    session_id: str,
+    data: ChatRequest,
+    request: Request,
+    user: Optional[dict] = Depends(get_optional_current_user)
+):
+    """Send a message and stream the assistant reply as Server-Sent Events.
+
+    One ``data:`` line per event from _stream_turn: ``start``, ``delta``s, then
+    ``done`` or ``error``.
+    """
+    supabase = get_supabase_client()
+    try:
+        await _check_session_owner(supabase, session_id, user)
+        held = await session_turns.acquire(session_id)
+    except SessionBusy as e:
+        raise _session_busy(e)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error sending message: {e}")
+    try:
+        try:
+            session = await _get_owned_session(supabase, session_id, user)
+            openai_messages, prompt_tokens, saved_tokens = await _prepare_turn(supabase, session, data)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error sending message: {e}")
+
+        cache_key = _completion_cache_key(data, session["model"], openai_messages)
+        cached = await completion_cache.get(cache_key) if cache_key else None
+        # Reserve before responding so a rate limit is reported as a 429, not mid-stream
+        lease = None if cached else await _acquire_completion_lease(_rate_limit_key(request, user), session["model"], prompt_tokens)
+    except BaseException:
+        await held.release()
+        raise
+
+    events = _stream_turn(
+        supabase, session, data, user, openai_messages, prompt_tokens, saved_tokens, cache_key, cached, lease, held
+    )
+
+    async def body():
+        try:
+            async for event in events:
+                yield _sse_event(event)
+        finally:
+            # The session's next turn starts once this one is saved or abandoned
+            await events.aclose()
+            await held.release()
+
+    # Closing the body first saves a stream the client left mid-reply before the
+    # session is freed; the rest frees the session and the slot even if the
+    # client leaves before the stream starts
+    stream_body = body()
+
+    async def close_body():
+        await stream_body.aclose()
+
+    cleanup = BackgroundTasks()
+    cleanup.add_task(close_body)
+    cleanup.add_task(held.release)
+    if lease:
+        cleanup.add_task(lease.release)
+    return StreamingResponse(
+        stream_body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=cleanup
+    )
+
+# --- Batch ---
+def _ndjson(payload: Dict[str, Any]) -> bytes:
+    return encode_json(payload) + b"\n"
+
+async def _wait_for_completion_lease(limit_key: str, model: str, prompt_tokens: int) -> CompletionLease:
+    """_acquire_completion_lease, waiting out rate limits for up to BATCH_RATE_LIMIT_WAIT seconds"""
+    deadline = time.monotonic() + settings.BATCH_RATE_LIMIT_WAIT
+    while True:
+        try:
+            return await _acquire_completion_lease(limit_key, model, prompt_tokens)
+        except HTTPException as e:
+            wait = float((e.headers or {}).get("Retry-After", 1))
+            if time.monotonic() + wait > deadline:
+                raise
+            await asyncio.sleep(wait)
+
+async def _run_batch(
+    supabase,
+    items: List[ChatRequest],
+    user: dict,
+    limit_key: str,
+    concurrency: int
+) -> AsyncIterator[bytes]:
+    """Run batch items and yield one NDJSON line per item as it finishes, then an ``end`` line.
+
+    Completions run at most ``concurrency`` at a time; items for the same
+    session run in request order so each turn sees the one before it. Turns
+    are saved through a GroupCommit, so turns finishing together share one
+    record_chat_turns call.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    writer = GroupCommit(lambda entries: _record_turns(supabase, entries), settings.BATCH_PERSIST_SIZE)
+    lines: asyncio.Queue = asyncio.Queue()
+    by_session: Dict[str, List[int]] = {}
+    for index, item in enumerate(items):
+        by_session.setdefault(item.session_id, []).append(index)
+
+    async def run_item(index: int, data: ChatRequest) -> Dict[str, Any]:
+        try:
+            await _check_session_owner(supabase, data.session_id, user)
+            async with session_turns.turn(data.session_id):
+                async with semaphore:
+                    turn = await _complete_turn(
+                        supabase, data.session_id, data, user, limit_key, acquire_lease=_wait_for_completion_lease
+                    )
+                params = _turn_params(
+                    turn["session"], data, user, turn["content"],
+                    turn["input_tokens"], turn["output_tokens"], turn["saved_tokens"], turn["model"]
+                )
+                saved = await writer.submit((turn["session"], params))
+            return {"type": "result", "index": index, **_chat_response(turn, saved).model_dump()}
+        except SessionBusy as e:
+            return {"type": "error", "index": index, "session_id": data.session_id, "status": 409, "detail": e.detail}
+        except HTTPException as e:
+            return {"type": "error", "index": index, "session_id": data.session_id, "status": e.status_code, "detail": e.detail}
+        except Exception as e:
+            return {"type": "error", "index": index, "session_id": data.session_id, "status": 500, "detail": f"Error sending message: {e}"}
+
+    async def run_session(indexes: List[int]) -> None:
+        for index in indexes:
+            await lines.put(await run_item(index, items[index]))
+
+    tasks = [asyncio.create_task(run_session(indexes)) for indexes in by_session.values()]
+    succeeded = failed = 0
+    try:
+        for _ in range(len(items)):
+            line = await lines.get()
+            if line["type"] == "result":
+                succeeded += 1
+            else:
+                failed += 1
+            yield _ndjson(line)
+        yield _ndjson({"type": "end", "succeeded": succeeded, "failed": failed})
+    finally:
+        # The client went away or the batch is done; saves already queued still complete
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await writer.close()
+
+@router.post("/batch", dependencies=[Depends(enforce_chat_rate_limit)])
+async def batch_messages(
+    batch: BatchChatRequest,
+    request: Request,
+    user: dict = Depends(get_current_user)
+):
+    """Send many messages at once and stream the replies as NDJSON.
+
+    Each item is a ChatRequest run through the send_message pipeline (context,
+    completion cache, model routing, rate limits and cost accounting). Lines
+    arrive in completion order: ``{"type": "result", "index": i, ...}`` with
+    the ChatResponse fields, or ``{"type": "error", "index": i, "status",
+    "detail"}`` for an item that failed, and a final ``{"type": "end"}`` with
+    the counts. Items waiting on a rate limit are retried rather than failed.
+    """
+    if len(batch.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch holds at most {settings.BATCH_MAX_ITEMS} items")
+    concurrency = min(batch.concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY)
+    if settings.RATE_LIMIT_ENABLED and settings.RATE_LIMIT_MAX_CONCURRENT > 0:
+        # More would only bounce off the per-client completion slots
+        concurrency = min(concurrency, settings.RATE_LIMIT_MAX_CONCURRENT)
+    return StreamingResponse(
+        _run_batch(get_supabase_client(), batch.items, user, _rate_limit_key(request, user), concurrency),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- WebSocket Channel ---
+WS_CLOSE_UNAUTHORIZED = 4401
+WS_CLOSE_NOT_FOUND = 4404
+WS_CLOSE_TIMEOUT = 4408
+
+def _token_expiry(token: str) -> Optional[float]:
+    """exp claim of an already verified token"""
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.PyJWTError:
+        return None
+
+async def _ws_send(websocket: WebSocket, payload: Dict[str, Any]) -> None:
+    # A client that stops reading blocks the send once buffers fill; drop it
+    # after WS_SEND_TIMEOUT instead of holding the completion open
+    await asyncio.wait_for(websocket.send_json(payload), settings.WS_SEND_TIMEOUT)
+
+async def _ws_authenticate(websocket: WebSocket) -> Tuple[Optional[dict], Optional[float]]:
+    """Read the bearer token from the Authorization header or the first message.
+
+    Browsers cannot set headers on a WebSocket, so they send
+    ``{"type": "auth", "token": ...}`` first; a null token is anonymous.
+    Returns the user and the token's expiry time.
+    """
+    header = websocket.headers.get("authorization", "")
+    if header.lower().startswith("bearer "):
+        token = header[7:].strip()
+    else:
+        first = await asyncio.wait_for(websocket.receive_json(), settings.WS_AUTH_TIMEOUT)
+        if not isinstance(first, dict) or first.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="Expected an auth message")
+        token = first.get("token")
+    if not token:
+        return None, None
+    user = await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    return user, _token_expiry(token)
+
+async def _ws_turn(
+    websocket: WebSocket,
+    supabase,
+    session: Dict[str, Any],
+    user: Optional[dict],
+    limit_key: str,
+    incoming: Dict[str, Any]
+) -> None:
+    try:
+        data = ChatRequest(
+            message=incoming.get("message"),
+            session_id=session["id"],
+            model=session["model"],
+            cache=incoming.get("cache", True)
+        )
+    except ValidationError as e:
+        await _ws_send(websocket, {"type": "error", "status": 422, "detail": e.errors()[0]["msg"]})
+        return
+    lease = None
+    held = None
+    try:
+        await rate_limiter.check_request(limit_key)
+        held = await session_turns.acquire(session["id"])
+        # Re-read under the turn, as the SSE endpoint does, so a model change,
+        # summary or deletion made elsewhere applies to this turn
+        session = await _get_owned_session(supabase, session["id"], user)
+        data.model = session["model"]
+        openai_messages, prompt_tokens, saved_tokens = await _prepare_turn(supabase, session, data)
+        cache_key = _completion_cache_key(data, session["model"], openai_messages)
+        cached = await completion_cache.get(cache_key) if cache_key else None
+        if not cached:
+            lease = await _acquire_completion_lease(limit_key, session["model"], prompt_tokens)
+        events = _stream_turn(
+            supabase, session, data, user, openai_messages, prompt_tokens, saved_tokens, cache_key, cached, lease, held
+        )
+        try:
+            async for event in events:
+                await _ws_send(websocket, event)
+        finally:
+            await events.aclose()
+    except RateLimitExceeded as e:
+        await _ws_send(websocket, {"type": "error", "status": 429, "detail": e.detail, "retry_after": e.retry_after})
+    except SessionBusy as e:
+        await _ws_send(websocket, {"type": "error", "status": 409, "detail": e.detail, "retry_after": e.retry_after})
+    except HTTPException as e:
+        await _ws_send(websocket, {"type": "error", "status": e.status_code, "detail": e.detail})
+    except (WebSocketDisconnect, asyncio.TimeoutError):
+        # The connection itself failed; chat_websocket closes it
+        raise
+    except Exception as e:
+        # Like the SSE endpoint, a failed turn is reported and the connection stays open
+        logger.warning(f"Chat WebSocket turn on session {session['id']} failed: {e}")
+        await _ws_send(websocket, {"type": "error", "status": 500, "detail": f"Error sending message: {e}"})
+    finally:
+        if lease:
+            await lease.release()
+        if held:
+            await held.release()
+
+@router.websocket("/ws/{session_id}")
+async def chat_websocket(websocket: WebSocket, session_id: str):
+    """Multi-turn chat over one connection.
+
+    The token is verified and the session ownership checked once, at connect,
+    so a turn costs no auth round trips; each turn re-reads the session row, so
+    changes made through the REST endpoints apply from the next turn. Protocol
+    (JSON text frames):
+
+    - client ``{"type": "auth", "token": ...}`` first, unless an Authorization
+      header was sent; server replies ``{"type": "ready", ...}``
+    - client ``{"type": "message", "message": ..., "cache": true}`` runs a turn;
+      the server streams the same ``start``/``delta``/``done``/``error`` events
+      as the SSE endpoint. Turns run one at a time, in order.
+    - server ``{"type": "ping"}`` after WS_HEARTBEAT_INTERVAL of silence; any
+      client frame counts as a reply. Clients may send ``ping`` and get ``pong``.
+
+    Closes with 4401 (bad or expired token), 4404 (session not found) or 4408
+    (auth or heartbeat timeout, or a client not reading).
+    """
+    await websocket.accept()
+    supabase = get_supabase_client()
+    try:
+        try:
+            user, expires_at = await _ws_authenticate(websocket)
+        except HTTPException as e:
+            await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason=str(e.detail))
+            return
+        try:
+            session = await _get_owned_session(supabase, session_id, user)
+        except HTTPException as e:
+            await websocket.close(code=WS_CLOSE_NOT_FOUND, reason=str(e.detail))
+            return
+        limit_key = _rate_limit_key(websocket, user)
+        await _ws_send(websocket, {"type": "ready", "session_id": session_id, "model": session["model"]})
+
+        pinged = False
+        while True:
+            try:
+                incoming = await asyncio.wait_for(websocket.receive_json(), settings.WS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if pinged:
+                    await websocket.close(code=WS_CLOSE_TIMEOUT, reason="Heartbeat timeout")
+                    return
+                pinged = True
+                await _ws_send(websocket, {"type": "ping"})
+                continue
+            except ValueError:
+                await _ws_send(websocket, {"type": "error", "status": 400, "detail": "Invalid JSON"})
+                continue
+            pinged = False
+            kind = incoming.get("type") if isinstance(incoming, dict) else None
+            if kind == "ping":
+                await _ws_send(websocket, {"type": "pong"})
+            elif kind == "message":
+                if expires_at and time.time() >= expires_at:
+                    await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason="Token expired")
+                    return
+                await _ws_turn(websocket, supabase, session, user, limit_key, incoming)
+            elif kind != "pong":
+                await _ws_send(websocket, {"type": "error", "status": 400, "detail": f"Unknown message type {kind!r}"})
+    except WebSocketDisconnect:
+        return
+    except asyncio.TimeoutError:
+        await websocket.close(code=WS_CLOSE_TIMEOUT, reason="Timed out")
+    except Exception as e:
+        logger.error(f"Chat WebSocket for session {session_id} failed: {e}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
 
 @router.put("/sessions/{session_id}", response_model=ChatSession)
 async def update_session(
@@ -258,23 +1159,18 @@ async def update_session(
     user: Optional[dict] = Depends(get_optional_current_user)
 ):
     supabase = get_supabase_client()
+    update_data = {k: v for k, v in data.model_dump(exclude_unset=True).items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    update_data["updated_at"] = datetime.utcnow().isoformat()
     try:
-        # Validate session ownership
-        session_query = supabase.table("chat_sessions").select("*").eq("id", session_id)
-        if user:
-            session_query = session_query.eq("user_id", user.id)
-        else:
-            session_query = session_query.is_("user_id", None)
-        session_resp = session_query.single().execute()
-        if not session_resp.data:
+        # Ownership is part of the filter, so a session the caller does not own matches no row
+        update_query = supabase.table("chat_sessions").update(update_data).eq("id", session_id)
+        update_resp = await run_query(_owned_by(update_query, user))
+        if not update_resp.data:
             raise HTTPException(status_code=404, detail="Session not found or access denied")
-        update_data = {k: v for k, v in data.model_dump(exclude_unset=True).items() if v is not None}
-        if not update_data:
-            raise HTTPException(status_code=400, detail="No fields to update")
-        update_data["updated_at"] = datetime.utcnow().isoformat()
-        update_resp = supabase.table("chat_sessions").update(update_data).eq("id", session_id).execute()
-        if not update_resp.data or len(update_resp.data) == 0:
-            raise HTTPException(status_code=500, detail="Failed to update session")
+        history_cache.invalidate(session_id)
+        await session_list_cache.invalidate([session_owner(user.id if user else None)])
         return ChatSession(**update_resp.data[0])
     except HTTPException:
         raise
@@ -289,18 +1185,13 @@ async def delete_session(
 ):
     supabase = get_supabase_client()
     try:
-        # Validate session ownership
-        session_query = supabase.table("chat_sessions").select("*").eq("id", session_id)
-        if user:
-            session_query = session_query.eq("user_id", user.id)
-        else:
-            session_query = session_query.is_("user_id", None)
-        session_resp = session_query.single().execute()
-        if not session_resp.data:
+        # Delete session (cascade deletes messages); the deleted row comes back only if the caller owned it
+        delete_query = supabase.table("chat_sessions").delete().eq("id", session_id)
+        del_resp = await run_query(_owned_by(delete_query, user))
+        if not del_resp.data:
             raise HTTPException(status_code=404, detail="Session not found or access denied")
-        # Delete session (cascade deletes messages)
-        del_resp = supabase.table("chat_sessions").delete().eq("id", session_id).execute()
-        # Don't check del_resp.status_code; just assume success if no exception
+        history_cache.invalidate(session_id)
+        await session_list_cache.invalidate([session_owner(user.id if user else None)])
         return Response(status_code=204)
     except HTTPException:
         raise
@@ -312,16 +1203,189 @@ async def get_usage_summary(
     request: Request,
     user: Optional[dict] = Depends(get_optional_current_user)
 ):
+    """All-time token and cost totals, summed in the database from chat_usage_rollups"""
     supabase = get_supabase_client()
     try:
-        query = supabase.table("chat_sessions").select("total_tokens", "total_cost")
-        if user:
-            query = query.eq("user_id", user.id)
-        else:
-            query = query.is_("user_id", None)
-        response = query.execute()
-        total_tokens = sum(s["total_tokens"] or 0 for s in response.data) if response.data else 0
-        total_cost = sum(float(s["total_cost"] or 0) for s in response.data) if response.data else 0.0
-        return {"total_tokens": total_tokens, "total_cost": total_cost}
+        response = await run_query(supabase.rpc("chat_usage_totals", {"p_user_id": user.id if user else None}))
+        totals = response.data[0] if response.data else {}
+        return {"total_tokens": int(totals.get("total_tokens") or 0), "total_cost": float(totals.get("total_cost") or 0)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching usage summary: {e}") 
+
+@router.get("/cache/stats")
+async def get_completion_cache_stats(user: dict = Depends(get_current_user)):
+    """Completion cache hit rate and the tokens and cost it has saved (this worker)"""
+    return completion_cache.stats()
+
+@router.get("/usage", response_model=UsageReport)
+async def get_usage(
+    request: Request,
+    granularity: Literal["hour", "day"] = Query("day"),
+    start: Optional[datetime] = Query(None, description="Inclusive start (default: 30 days before end)"),
+    end: Optional[datetime] = Query(None, description="Exclusive end (default: now)"),
+    model: Optional[str] = Query(None),
+    user: Optional[dict] = Depends(get_optional_current_user)
+):
+    """Token usage and cost by hour or day and model, from the hourly rollups.
+
+    Buckets are UTC. Rollups are kept by record_chat_turn, so the cost of this
+    query depends on the date range, not on how much history the user has.
+    """
+    # Naive datetimes are taken as UTC
+    end = end or datetime.now(timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    start = start or end - timedelta(days=30)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > USAGE_MAX_RANGE[granularity]:
+        raise HTTPException(status_code=400, detail=f"Range too large for {granularity} granularity")
+    supabase = get_supabase_client()
+    try:
+        response = await run_query(supabase.rpc("chat_usage_report", {
+            "p_user_id": user.id if user else None,
+            "p_from": start.isoformat(),
+            "p_to": end.isoformat(),
+            "p_granularity": granularity,
+            "p_model": model
+        }))
+        buckets = [
+            UsageBucket(
+                bucket=row["bucket"],
+                model=row["model"],
+                input_tokens=row["input_tokens"],
+                output_tokens=row["output_tokens"],
+                total_tokens=row["input_tokens"] + row["output_tokens"],
+                cost=float(row["cost"]),
+                requests=row["requests"]
+            )
+            for row in (response.data or [])
+        ]
+        return UsageReport(
+            granularity=granularity,
+            start=start,
+            end=end,
+            buckets=buckets,
+            input_tokens=sum(b.input_tokens for b in buckets),
+            output_tokens=sum(b.output_tokens for b in buckets),
+            total_tokens=sum(b.total_tokens for b in buckets),
+            cost=sum(b.cost for b in buckets)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching usage: {e}")
+
+class SearchHit(BaseModel):
+    message_id: str
+    session_id: str
+    session_title: str
+    role: str
+    created_at: datetime
+    rank: float
+    snippet: str  # HTML-escaped, matched terms wrapped in <mark>
+
+def _highlight(snippet: str) -> str:
+    """Escape a search_chat_messages snippet and turn its match markers into <mark> tags"""
+    return html.escape(snippet).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+@router.get("/search", response_model=List[SearchHit])
+async def search_messages(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200, description="Search terms (web search syntax)"),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = Query(None, description="Cursor for the next page of results"),
+    user: dict = Depends(get_current_user)
+):
+    """Full-text search over the caller's messages, best match first.
+
+    Backed by the search_chat_messages function and its GIN index
+    (supabase/migrations). When more results exist, X-Next-Cursor holds the
+    cursor to pass back as ``after``.
+    """
+    supabase = get_supabase_client()
+    try:
+        after_rank, after_id = decode_cursor(after) if after else (None, None)
+        result = await run_query(supabase.rpc("search_chat_messages", {
+            "p_user_id": user.id,
+            "p_query": q,
+            "p_limit": limit + 1,
+            "p_after_rank": float(after_rank) if after_rank is not None else None,
+            "p_after_id": after_id
+        }))
+        rows = result.data or []
+        headers = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers = {"X-Next-Cursor": encode_cursor(rows[-1]["rank"], rows[-1]["id"])}
+        hits = [
+            {
+                "message_id": row["id"],
+                "session_id": row["session_id"],
+                "session_title": row["session_title"],
+                "role": row["role"],
+                "created_at": row["created_at"],
+                "rank": row["rank"],
+                "snippet": _highlight(row["snippet"] or "")
+            }
+            for row in rows
+        ]
+        return fast_json_response(request, hits, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching messages: {e}")
+
+class ImportResult(BaseModel):
+    sessions: int
+    messages: int
+
+@router.get("/export")
+async def export_history(
+    compress: Optional[Literal["gzip"]] = Query(None, description="Compress the export"),
+    user: dict = Depends(get_current_user)
+):
+    """Download all of the caller's sessions and messages as NDJSON.
+
+    One JSON object per line: each page of ``session`` records is followed by
+    the ``message`` records of those sessions, and a final ``end`` record
+    carries the counts. Streamed page by page, so memory use does not grow
+    with the size of the history.
+    """
+    supabase = get_supabase_client()
+    body = export_chat_history(supabase, user.id)
+    filename = "chat-export.ndjson"
+    media_type = "application/x-ndjson"
+    if compress == "gzip":
+        body = gzip_stream(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import", response_model=ImportResult)
+async def import_history(request: Request, user: dict = Depends(get_current_user)):
+    """Import an NDJSON export (plain or gzip) into new sessions owned by the caller.
+
+    The body is parsed as it arrives and inserted in batches of IMPORT_BATCH_SIZE rows.
+    """
+    supabase = get_supabase_client()
+    importer = ChatImporter(supabase, user.id, settings.IMPORT_BATCH_SIZE)
+    try:
+        async for line_no, record in read_ndjson(request.stream()):
+            await importer.add(line_no, record)
+        await importer.finish()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{e} (imported {importer.sessions} sessions and {importer.messages} messages before the error)"
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching usage summary: {e}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error importing chat history: {e}")
+    finally:
+        # Batches inserted before an error stay imported
+        await session_list_cache.invalidate([session_owner(user.id)])
+    return ImportResult(sessions=importer.sessions, messages=importer.messages)
@@ -1,23 +1,37 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from app.models.schemas import Profile, ProfileUpdate
 from app.services.profile_service import get_user_profile, update_user_profile
+from app.services.json_response import encode_json, trusted_row
+from app.services.response_cache import profile_cache, CachedResponse, conditional_response, weak_etag
 from app.middleware.auth import require_auth
 from typing import Dict, Any
 
 router = APIRouter(prefix="/api/profiles", tags=["profiles"])
 
 @router.get("/me", response_model=Profile)
-async def get_current_user_profile(current_user: dict = Depends(require_auth)):
-    """Get current user's profile"""
+async def get_current_user_profile(request: Request, current_user: dict = Depends(require_auth)):
+    """Get current user's profile.
+
+    Carries a weak ETag from updated_at; a matching If-None-Match gets a 304.
+    Served from profile_cache for RESPONSE_CACHE_TTL after each read.
+    """
     try:
         user_id = current_user.id
-        profile_data = await get_user_profile(user_id)
-        if not profile_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Profile not found"
+        cached = await profile_cache.get(user_id)
+        if cached is None:
+            profile_data = await get_user_profile(user_id)
+            if not profile_data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Profile not found"
+                )
+            cached = CachedResponse(
+                encode_json(trusted_row(profile_data, Profile)),
+                weak_etag(user_id, profile_data["updated_at"]),
+                {}
             )
-        return profile_data
+            await profile_cache.set(user_id, cached)
+        return conditional_response(request, cached)
     except HTTPException:
         raise
     except Exception as e:
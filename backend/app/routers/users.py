@@ -1,24 +1,26 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional
-from app.services.users_service import get_all_users, get_user_by_id
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import List, Literal, Optional
+from app.services.users_service import get_users_page, get_user_by_id
+from app.services.json_response import fast_json_response, trusted_rows
 from app.models.schemas import User, UserResponse
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 @router.get("/", response_model=UserResponse)
 async def list_users(
+    request: Request,
     limit: Optional[int] = Query(10, ge=1, le=100, description="Number of users to return"),
-    offset: Optional[int] = Query(0, ge=0, description="Number of users to skip")
+    offset: Optional[int] = Query(0, ge=0, description="Number of users to skip"),
+    count: Literal["exact", "planned", "estimated"] = Query("exact", description="How the total user count is computed")
 ):
     """Get all users with pagination"""
     try:
-        users_data = await get_all_users()
-        # Apply pagination
-        paginated_users = users_data[offset:offset + limit]
-        return UserResponse(
-            users=paginated_users,
-            count=len(users_data)
-        )
+        # Only select the columns the response model returns
+        users_data, total = await get_users_page(limit, offset, columns=",".join(User.model_fields), count=count)
+        return fast_json_response(request, {
+            "users": trusted_rows(users_data, User),
+            "count": total or 0
+        })
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -48,11 +50,11 @@ async def get_user(user_id: str):
 async def test_users_table():
     """Test connection to users table"""
     try:
-        users_data = await get_all_users()
+        users_data, total = await get_users_page(1, count="exact")
         return {
             "status": "success",
             "message": "Successfully connected to users table",
-            "total_users": len(users_data),
+            "total_users": total or 0,
             "sample_user": users_data[0] if users_data else None
         }
     except Exception as e:
@@ -1,5 +1,5 @@
 from typing import Dict, Any, Optional
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, create_supabase_client, run_query, run_sync
 from app.models.schemas import LoginRequest, SignupRequest, PasswordUpdateRequest, ForgotPasswordRequest, ResetPasswordRequest
 import logging
 
@@ -8,8 +8,8 @@ logger = logging.getLogger(__name__)
 async def authenticate_user(login_data: LoginRequest) -> Dict[str, Any]:
     """Authenticate user with Supabase"""
     try:
-        supabase = get_supabase_client()
-        response = supabase.auth.sign_in_with_password({
+        supabase = create_supabase_client()
+        response = await run_sync(supabase.auth.sign_in_with_password, {
             "email": login_data.email,
             "password": login_data.password
         })
@@ -27,8 +27,8 @@ async def authenticate_user(login_data: LoginRequest) -> Dict[str, Any]:
 async def create_user(signup_data: SignupRequest) -> Dict[str, Any]:
     """Create new user with Supabase"""
     try:
-        supabase = get_supabase_client()
-        response = supabase.auth.sign_up({
+        supabase = create_supabase_client()
+        response = await run_sync(supabase.auth.sign_up, {
             "email": signup_data.email,
             "password": signup_data.password,
             "options": {
@@ -61,7 +61,7 @@ async def create_user_profile(user_id: str, display_name: str) -> None:
             "created_at": "now()",
             "updated_at": "now()"
         }
-        supabase.table("profiles").insert(profile_data).execute()
+        await run_query(supabase.table("profiles").insert(profile_data))
         logger.info(f"Created profile for user: {user_id}")
     except Exception as e:
         logger.error(f"Profile creation error: {e}")
@@ -70,8 +70,8 @@ async def create_user_profile(user_id: str, display_name: str) -> None:
 async def refresh_token(refresh_token: str) -> Dict[str, Any]:
     """Refresh Supabase session token"""
     try:
-        supabase = get_supabase_client()
-        response = supabase.auth.refresh_session(refresh_token)
+        supabase = create_supabase_client()
+        response = await run_sync(supabase.auth.refresh_session, refresh_token)
         if not response.session:
             raise ValueError("Failed to refresh token")
         return {
@@ -89,7 +89,7 @@ async def update_password(user_id: str, data: PasswordUpdateRequest) -> None:
     try:
         supabase = get_supabase_client()
         # Supabase requires the user to be authenticated; update_user expects the new password
-        response = supabase.auth.admin.update_user_by_id(user_id, {"password": data.new_password})
+        response = await run_sync(supabase.auth.admin.update_user_by_id, user_id, {"password": data.new_password})
         if response.user is None:
             raise ValueError("Failed to update password")
     except Exception as e:
@@ -101,7 +101,8 @@ async def forgot_password(data: ForgotPasswordRequest) -> None:
     try:
         supabase = get_supabase_client()
         # Add redirectTo so the email link points to the frontend reset page
-        response = supabase.auth.reset_password_for_email(
+        response = await run_sync(
+            supabase.auth.reset_password_for_email,
             data.email,
             {"redirectTo": "http://localhost:3000/auth/update-password"}
         )
@@ -114,9 +115,9 @@ async def forgot_password(data: ForgotPasswordRequest) -> None:
 async def reset_password(data: ResetPasswordRequest) -> None:
     """Reset password using a token (from email link)"""
     try:
-        supabase = get_supabase_client()
+        supabase = create_supabase_client()
         # This is a placeholder; actual implementation may depend on Supabase SDK
-        response = supabase.auth.update_user({"password": data.new_password}, data.token)
+        response = await run_sync(supabase.auth.update_user, {"password": data.new_password}, data.token)
         if response.user is None:
             raise ValueError("Failed to reset password")
     except Exception as e:
@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from typing import Any, Optional
+from app.config import settings
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry TTL. Values are stored as-is."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RedisCacheBackend:
+    """Shared cache in Redis for multi-worker deployments. Values must be JSON-serialisable."""
+
+    def __init__(self, url: str, namespace: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis cache backend (pip install redis)")
+        self._redis = redis.from_url(url)
+        self.namespace = namespace
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._redis.get(f"{self.namespace}:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self._redis.set(f"{self.namespace}:{key}", json.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(f"{self.namespace}:{key}")
+
+def create_cache_backend(namespace: str, max_entries: int, backend: Optional[str] = None):
+    """Build the configured cache backend ("memory" or "redis") for one cache"""
+    backend = backend or settings.CACHE_BACKEND
+    if backend == "redis":
+        return RedisCacheBackend(settings.REDIS_URL, namespace)
+    if backend != "memory":
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return MemoryCacheBackend(max_entries)
@@ -0,0 +1,223 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Annotated
+from pydantic import BaseModel, Field, ValidationError, constr
+from datetime import datetime
+from postgrest.types import ReturnMethod
+from app.config import settings
+from app.services.pagination import encode_cursor, keyset_scan
+from app.services.supabase_client import run_query
+import json
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+MAX_LINE_BYTES = 4 * 1024 * 1024
+# Decompressed bytes produced per step, so a small gzip body cannot expand unchecked
+DECOMPRESS_CHUNK = 1024 * 1024
+
+def _line(kind: str, row: Dict[str, Any]) -> bytes:
+    return (json.dumps({"type": kind, **row}, default=str, separators=(",", ":")) + "\n").encode()
+
+async def export_chat_history(supabase, user_id: str) -> AsyncIterator[bytes]:
+    """Stream a user's sessions and messages as NDJSON, one page at a time.
+
+    Sessions are read oldest first in pages of EXPORT_SESSION_PAGE_SIZE; each
+    page is followed by the messages of its sessions, read in pages of
+    EXPORT_MESSAGE_PAGE_SIZE. Only one page is held in memory. The last line is
+    ``{"type": "end", ...}`` with the counts, or ``{"type": "error", ...}`` if a
+    read failed after the response had started, so a truncated file is detectable.
+    """
+    session_page = settings.EXPORT_SESSION_PAGE_SIZE
+    message_page = settings.EXPORT_MESSAGE_PAGE_SIZE
+    session_count = message_count = 0
+    session_cursor: Optional[str] = None
+    try:
+        while True:
+            query = supabase.table("chat_sessions").select("*").eq("user_id", user_id)
+            sessions = (await run_query(keyset_scan(query, "created_at", session_page, session_cursor))).data or []
+            if not sessions:
+                break
+            session_count += len(sessions)
+            yield b"".join(_line("session", s) for s in sessions)
+
+            session_ids = [s["id"] for s in sessions]
+            message_cursor: Optional[str] = None
+            while True:
+                query = supabase.table("chat_messages").select("*").in_("session_id", session_ids)
+                messages = (await run_query(keyset_scan(query, "created_at", message_page, message_cursor))).data or []
+                if messages:
+                    message_count += len(messages)
+                    yield b"".join(_line("message", m) for m in messages)
+                if len(messages) < message_page:
+                    break
+                message_cursor = encode_cursor(messages[-1]["created_at"], messages[-1]["id"])
+
+            if len(sessions) < session_page:
+                break
+            session_cursor = encode_cursor(sessions[-1]["created_at"], sessions[-1]["id"])
+    except Exception as e:
+        logger.error(f"Chat export for user {user_id} failed: {e}")
+        yield _line("error", {"detail": f"Export failed: {e}", "sessions": session_count, "messages": message_count})
+        return
+    yield _line("end", {"sessions": session_count, "messages": message_count})
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+async def _decompressed(body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Pass the body through, gunzipping it if it starts with the gzip magic"""
+    decompressor = None
+    first = True
+    async for chunk in body:
+        if first and chunk:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(31)
+        if decompressor is None:
+            yield chunk
+            continue
+        data = decompressor.decompress(chunk, DECOMPRESS_CHUNK)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, DECOMPRESS_CHUNK)
+    if decompressor is not None:
+        yield decompressor.flush()
+
+async def read_ndjson(body: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """Parse an NDJSON (optionally gzip) request body incrementally into (line number, object)"""
+    buffer = b""
+    line_no = 0
+    async for chunk in _decompressed(body):
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Line {line_no + len(lines) + 1} is longer than {MAX_LINE_BYTES} bytes")
+        for raw in lines:
+            line_no += 1
+            if raw.strip():
+                yield line_no, _parse_line(line_no, raw)
+    if buffer.strip():
+        yield line_no + 1, _parse_line(line_no + 1, buffer)
+
+def _parse_line(line_no: int, raw: bytes) -> Dict[str, Any]:
+    try:
+        record = json.loads(raw)
+    except ValueError:
+        raise ValueError(f"Line {line_no}: invalid JSON")
+    if not isinstance(record, dict):
+        raise ValueError(f"Line {line_no}: expected a JSON object")
+    return record
+
+class _ImportedSession(BaseModel):
+    id: str
+    title: str = Field(..., max_length=100)
+    model: Annotated[str, constr(pattern=r"^gpt-(3\.5-turbo|4|4-turbo)$")]
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    total_tokens: int = 0
+    total_cost: float = 0.0
+
+class _ImportedMessage(BaseModel):
+    session_id: str
+    role: Annotated[str, constr(pattern=r"^(user|assistant|system)$")]
+    content: str
+    tokens: int = 0
+    cost: float = 0.0
+    created_at: Optional[datetime] = None
+    model: Optional[str] = None
+    saved_tokens: Optional[int] = None
+    saved_cost: Optional[float] = None
+
+class ChatImporter:
+    """Batch-inserts exported sessions and messages for one user.
+
+    Imported sessions get new ids; messages are re-pointed at them, so an
+    export can be imported alongside the sessions it came from. Each batch is
+    its own insert, so on an error the batches before it stay imported.
+    """
+
+    def __init__(self, supabase, user_id: str, batch_size: int):
+        self.supabase = supabase
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.sessions = 0
+        self.messages = 0
+        self._session_ids: Dict[str, str] = {}
+        self._pending_sessions: List[Tuple[str, Dict[str, Any]]] = []
+        self._pending_session_ids = set()
+        self._pending_messages: List[Dict[str, Any]] = []
+
+    async def add(self, line_no: int, record: Dict[str, Any]) -> None:
+        kind = record.get("type")
+        try:
+            if kind == "session":
+                await self._add_session(line_no, _ImportedSession(**record))
+            elif kind == "message":
+                await self._add_message(line_no, _ImportedMessage(**record))
+            elif kind == "error":
+                raise ValueError(f"Line {line_no}: the export is incomplete ({record.get('detail')})")
+            elif kind != "end":
+                raise ValueError(f"Line {line_no}: unknown record type {kind!r}")
+        except ValidationError as e:
+            raise ValueError(f"Line {line_no}: {e.errors()[0]['loc'][0]}: {e.errors()[0]['msg']}")
+
+    async def _add_session(self, line_no: int, session: _ImportedSession) -> None:
+        if session.id in self._session_ids or session.id in self._pending_session_ids:
+            raise ValueError(f"Line {line_no}: duplicate session {session.id}")
+        row = session.model_dump(mode="json", exclude={"id"}, exclude_none=True)
+        row["user_id"] = self.user_id
+        self._pending_sessions.append((session.id, row))
+        self._pending_session_ids.add(session.id)
+        if len(self._pending_sessions) >= self.batch_size:
+            await self._flush_sessions()
+
+    async def _add_message(self, line_no: int, message: _ImportedMessage) -> None:
+        if message.session_id not in self._session_ids and message.session_id not in self._pending_session_ids:
+            raise ValueError(f"Line {line_no}: message for unknown session {message.session_id}")
+        row = message.model_dump(mode="json", exclude_none=True)
+        if message.role == "user":
+            row["user_id"] = self.user_id
+        self._pending_messages.append(row)
+        if len(self._pending_messages) >= self.batch_size:
+            await self._flush_messages()
+
+    async def _flush_sessions(self) -> None:
+        if not self._pending_sessions:
+            return
+        # Columns missing from an exported row take the table default instead of null
+        response = await run_query(self.supabase.table("chat_sessions").insert(
+            [row for _, row in self._pending_sessions],
+            default_to_null=False
+        ))
+        created = response.data or []
+        if len(created) != len(self._pending_sessions):
+            raise RuntimeError("Session insert returned an unexpected number of rows")
+        # PostgREST returns inserted rows in request order
+        for (old_id, _), row in zip(self._pending_sessions, created):
+            self._session_ids[old_id] = row["id"]
+        self.sessions += len(created)
+        self._pending_sessions = []
+        self._pending_session_ids = set()
+
+    async def _flush_messages(self) -> None:
+        if not self._pending_messages:
+            return
+        await self._flush_sessions()
+        rows = [{**m, "session_id": self._session_ids[m["session_id"]]} for m in self._pending_messages]
+        await run_query(self.supabase.table("chat_messages").insert(
+            rows,
+            returning=ReturnMethod.minimal,
+            default_to_null=False
+        ))
+        self.messages += len(rows)
+        self._pending_messages = []
+
+    async def finish(self) -> None:
+        await self._flush_sessions()
+        await self._flush_messages()
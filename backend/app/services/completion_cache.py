@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.services.cache_backends import create_cache_backend
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def completion_cache_key(model: str, messages: List[Dict[str, str]], **params: Any) -> str:
+    """Hash of everything that determines a completion: model, sampling params and messages"""
+    payload = json.dumps({"model": model, "params": params, "messages": messages}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class CompletionCache:
+    """Completion results keyed by completion_cache_key, with hit-rate accounting.
+
+    Cached values hold the reply content plus the tokens and cost of the call
+    that produced it, so each hit can be counted as saved spend. Backend
+    errors are logged and treated as misses.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.saved_cost = 0.0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Completion cache lookup failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_tokens += value["input_tokens"] + value["output_tokens"]
+        self.saved_cost += value["cost"]
+        return value
+
+    async def set(self, key: str, content: str, input_tokens: int, output_tokens: int, cost: float) -> None:
+        value = {"content": content, "input_tokens": input_tokens, "output_tokens": output_tokens, "cost": cost}
+        try:
+            await self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"Completion cache store failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.COMPLETION_CACHE_ENABLED,
+            "backend": settings.CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "saved_cost": self.saved_cost
+        }
+
+completion_cache = CompletionCache(
+    create_cache_backend("completions", settings.COMPLETION_CACHE_MAX_ENTRIES),
+    ttl=settings.COMPLETION_CACHE_TTL
+)
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Context window per model (prompt + completion tokens)
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+# Encoding for models tiktoken does not know
+DEFAULT_ENCODING = "cl100k_base"
+ENCODING_RETRY_INTERVAL = 60
+TOKEN_COUNT_CACHE_SIZE = 16384
+
+# Chat format overhead, per the OpenAI cookbook token counting recipe
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+_encodings: Dict[str, Any] = {}
+# (text digest, text length, encoding name) -> token count, least recently used first
+_token_counts: "OrderedDict[Tuple[bytes, int, str], int]" = OrderedDict()
+
+class ContextTooLargeError(ValueError):
+    """The pinned messages alone do not fit the model's prompt budget"""
+
+def _load_encoding(model: str):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+async def load_encodings() -> None:
+    """Load the tokenizer for every known model off the event loop.
+
+    tiktoken may download its encoding files on first use, so this runs in a
+    thread from the app lifespan and retries failures every
+    ENCODING_RETRY_INTERVAL until all are loaded. Until then count_tokens
+    falls back to the length estimate.
+    """
+    pending = [*MODEL_CONTEXT_WINDOWS, DEFAULT_ENCODING]
+    retrying = False
+    while True:
+        for model in list(pending):
+            try:
+                _encodings[model] = await asyncio.to_thread(_load_encoding, model)
+                pending.remove(model)
+            except Exception as e:
+                log = logger.debug if retrying else logger.warning
+                log(f"Tokenizer unavailable for {model}, using length estimate: {e}")
+        if not pending:
+            return
+        retrying = True
+        await asyncio.sleep(ENCODING_RETRY_INTERVAL)
+
+def _get_encoding(model: str):
+    """Loaded encoding for model (cl100k_base for unknown models); None until loaded"""
+    return _encodings.get(model) or _encodings.get(DEFAULT_ENCODING)
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Rough fallback: 1 token ≈ 4 chars (for English)
+        return max(1, len(text) // 4)
+    # Keyed on a digest of the text, so the cache holds no message bodies
+    key = (hashlib.blake2b(text.encode(), digest_size=16).digest(), len(text), encoding.name)
+    count = _token_counts.get(key)
+    if count is None:
+        count = len(encoding.encode(text, disallowed_special=()))
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    else:
+        _token_counts.move_to_end(key)
+    return count
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str) -> int:
+    """Prompt tokens OpenAI will bill for this message list"""
+    return TOKENS_PER_REPLY + sum(
+        TOKENS_PER_MESSAGE + count_tokens(m["content"], model) + count_tokens(m["role"], model)
+        for m in messages
+    )
+
+def prompt_budget(model: str, max_tokens: int) -> int:
+    """Prompt tokens available once max_tokens is reserved for the reply"""
+    budget = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) - max_tokens
+    if settings.CONTEXT_MAX_PROMPT_TOKENS:
+        budget = min(budget, settings.CONTEXT_MAX_PROMPT_TOKENS)
+    return budget
+
+def build_context(
+    messages: List[Dict[str, str]],
+    model: str,
+    max_tokens: int,
+    budget: Optional[int] = None
+) -> Tuple[List[Dict[str, str]], int]:
+    """Trim a conversation to the model's prompt budget.
+
+    System messages and the final (newest) message are pinned; the oldest of
+    the remaining messages are dropped first. Returns the messages to send and
+    their prompt token count.
+    """
+    if budget is None:
+        budget = prompt_budget(model, max_tokens)
+    costs = [TOKENS_PER_MESSAGE + count_tokens(m["content"], model) + count_tokens(m["role"], model) for m in messages]
+    last = len(messages) - 1
+    pinned = {i for i, m in enumerate(messages) if m["role"] == "system" or i == last}
+    used = TOKENS_PER_REPLY + sum(costs[i] for i in pinned)
+    if used > budget:
+        raise ContextTooLargeError(f"Message needs {used} prompt tokens, limit for {model} is {budget}")
+    # Keep the newest unpinned messages that still fit
+    keep = set(pinned)
+    for i in range(last - 1, -1, -1):
+        if i in pinned:
+            continue
+        if used + costs[i] > budget:
+            break
+        used += costs[i]
+        keep.add(i)
+    if len(keep) < len(messages):
+        logger.debug(f"Trimmed context for {model} from {len(messages)} to {len(keep)} messages")
+    return [m for i, m in enumerate(messages) if i in keep], used
@@ -0,0 +1,159 @@
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from app.config import settings
+from app.services.context_builder import count_message_tokens, count_tokens, prompt_budget, TOKENS_PER_MESSAGE
+from app.services.metrics import record_usage
+from app.services.openai_client import get_openai_client
+from app.services.response_cache import session_list_cache, session_owner
+from app.services.supabase_client import get_supabase_client, run_query
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One row per session, embedded into the session query (supabase/migrations)
+SUMMARY_TABLE = "chat_session_summaries"
+SUMMARY_COLUMNS = f"*,{SUMMARY_TABLE}(summary,covered_messages,summary_tokens)"
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+SUMMARIZE_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the new messages into the existing summary. Keep facts, decisions, names, numbers "
+    "and open questions; drop pleasantries. Reply with the updated summary only."
+)
+
+def session_summary(session: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The summary row embedded in a session fetched with SUMMARY_COLUMNS, if any"""
+    row = session.get(SUMMARY_TABLE)
+    # PostgREST returns a one-to-one embed as an object, older versions as a list
+    if isinstance(row, list):
+        row = row[0] if row else None
+    return row or None
+
+def apply_summary(
+    history: List[Dict[str, str]],
+    summary: Optional[Dict[str, Any]]
+) -> Tuple[List[Dict[str, str]], int]:
+    """Replace the summarized prefix of history with one system message.
+
+    Returns the compacted history and how many leading messages it covers.
+    A summary covering more messages than the history holds is stale and ignored.
+    """
+    if not summary or summary["covered_messages"] > len(history):
+        return history, 0
+    covered = summary["covered_messages"]
+    return [{"role": "system", "content": SUMMARY_PREFIX + summary["summary"]}] + history[covered:], covered
+
+class ConversationSummarizer:
+    """Folds older turns of long sessions into a stored running summary.
+
+    Refreshes run as background tasks after the triggering turn has been
+    prepared, so the summarization call never adds to request latency. At most
+    one refresh per session runs in this worker, and the database only accepts
+    a summary that covers more messages than the stored one.
+    """
+
+    def __init__(self, trigger_tokens: int, keep_messages: int, model: str, max_tokens: int):
+        self.trigger_tokens = trigger_tokens
+        self.keep_messages = keep_messages
+        self.model = model
+        self.max_tokens = max_tokens
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def maybe_refresh(
+        self,
+        session: Dict[str, Any],
+        history: List[Dict[str, str]],
+        summary: Optional[Dict[str, Any]],
+        covered: int,
+        cost_fn: Callable[[str, int, int], float]
+    ) -> bool:
+        """Start a background refresh if the unsummarized history is over the trigger.
+
+        A saved summary is also set on ``session``, so a caller holding the
+        session across turns uses it without re-reading the row.
+        """
+        session_id = session["id"]
+        foldable = len(history) - self.keep_messages
+        if session_id in self._running or foldable <= covered:
+            return False
+        if count_message_tokens(history[covered:], self.model) < self.trigger_tokens:
+            return False
+        self._running.add(session_id)
+        task = asyncio.create_task(self._refresh(session, list(history), summary if covered else None, covered, cost_fn))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def _fold_range(self, history: List[Dict[str, str]], covered: int, previous: str) -> int:
+        """End index of the messages to fold this round, bounded by the summary model's prompt budget"""
+        budget = prompt_budget(self.model, self.max_tokens) - count_tokens(SUMMARIZE_INSTRUCTIONS + previous, self.model) - 64
+        end = covered
+        for i in range(covered, len(history) - self.keep_messages):
+            budget -= TOKENS_PER_MESSAGE + count_tokens(history[i]["content"], self.model)
+            if budget < 0:
+                break
+            end = i + 1
+        return end
+
+    async def _refresh(
+        self,
+        session: Dict[str, Any],
+        history: List[Dict[str, str]],
+        summary: Optional[Dict[str, Any]],
+        covered: int,
+        cost_fn: Callable[[str, int, int], float]
+    ) -> None:
+        session_id = session["id"]
+        try:
+            previous = summary["summary"] if summary else ""
+            end = self._fold_range(history, covered, previous)
+            if end <= covered:
+                return
+            transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in history[covered:end])
+            response = await get_openai_client().chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARIZE_INSTRUCTIONS},
+                    {"role": "user", "content": f"Existing summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"}
+                ],
+                max_tokens=self.max_tokens,
+                temperature=0
+            )
+            text = response.choices[0].message.content.strip()
+            usage = response.usage
+            cost = cost_fn(self.model, usage.prompt_tokens, usage.completion_tokens)
+            record_usage(self.model, usage.prompt_tokens, usage.completion_tokens, cost)
+            summary_tokens = count_tokens(text, self.model)
+            saved = await run_query(get_supabase_client().rpc("save_chat_summary", {
+                "p_session_id": session_id,
+                "p_summary": text,
+                "p_covered_messages": end,
+                "p_summary_tokens": summary_tokens,
+                "p_model": self.model,
+                "p_input_tokens": usage.prompt_tokens,
+                "p_output_tokens": usage.completion_tokens,
+                "p_cost": cost
+            }))
+            # The session totals include the summarization call either way
+            await session_list_cache.invalidate([session_owner(session.get("user_id"))])
+            if saved.data:
+                session[SUMMARY_TABLE] = {"summary": text, "covered_messages": end, "summary_tokens": summary_tokens}
+            logger.debug("Summarized session %s through message %s", session_id, end)
+        except Exception as e:
+            logger.warning(f"Conversation summary for session {session_id} failed: {e}")
+        finally:
+            self._running.discard(session_id)
+
+    async def close(self) -> None:
+        """Cancel refreshes still running at shutdown; the next turn re-triggers them"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+conversation_summarizer = ConversationSummarizer(
+    trigger_tokens=settings.SUMMARY_TRIGGER_TOKENS,
+    keep_messages=settings.SUMMARY_KEEP_MESSAGES,
+    model=settings.SUMMARY_MODEL,
+    max_tokens=settings.SUMMARY_MAX_TOKENS
+)
@@ -0,0 +1,54 @@
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class GroupCommit:
+    """Coalesce concurrent writes into bulk calls.
+
+    submit() queues one item and waits for its result. Items submitted while a
+    flush is in flight go out together in the next one, up to max_batch per
+    call, so N concurrent writers cost about as many round trips as there are
+    flushes instead of N. ``flush`` receives the queued items and returns one
+    result per item in order; an exception instance as a result fails only
+    that item, while an exception raised by ``flush`` fails the whole call.
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], Awaitable[List[Any]]], max_batch: int):
+        self._flush = flush
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self) -> None:
+        # Not cancelled with the waiters: writes already sent are seen through
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            try:
+                results = await self._flush([item for item, _ in batch])
+            except Exception as e:
+                logger.warning(f"Group commit of {len(batch)} items failed: {e}")
+                results = [e] * len(batch)
+            self.flushes += 1
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self) -> None:
+        """Wait for queued writes to finish"""
+        if self._flusher is not None:
+            await asyncio.gather(self._flusher, return_exceptions=True)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from app.config import settings
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ("messages", "version", "size", "expires_at")
+
+    def __init__(self, messages: List[Dict[str, str]], version: Optional[str], size: int, expires_at: float):
+        self.messages = messages
+        self.version = version
+        self.size = size
+        self.expires_at = expires_at
+
+def _message_size(message: Dict[str, str]) -> int:
+    return len(message["content"]) + len(message["role"])
+
+class HistoryCache:
+    """Per-session OpenAI message history with LRU/TTL eviction.
+
+    Entries are tagged with the session row's ``updated_at`` so a turn
+    persisted by another worker (which bumps ``updated_at``) turns the next
+    lookup here into a miss instead of serving a stale transcript. Memory is
+    bounded by session count and total content size (characters).
+    """
+
+    def __init__(self, max_sessions: int, max_chars: int, ttl: float):
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str, version: Optional[str]) -> Optional[List[Dict[str, str]]]:
+        entry = self._entries.get(session_id)
+        if entry is None or entry.version != version or entry.expires_at < time.monotonic():
+            if entry is not None:
+                self.invalidate(session_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return list(entry.messages)
+
+    def set(self, session_id: str, messages: List[Dict[str, str]], version: Optional[str]) -> None:
+        self.invalidate(session_id)
+        size = sum(_message_size(m) for m in messages)
+        if size > self.max_chars:
+            return
+        self._entries[session_id] = _Entry(list(messages), version, size, time.monotonic() + self.ttl)
+        self._size += size
+        self._evict()
+
+    def append(self, session_id: str, messages: List[Dict[str, str]], base_version: Optional[str], version: Optional[str]) -> None:
+        """Add a saved turn's messages to a history cached at ``base_version``.
+
+        ``base_version`` is the session's ``updated_at`` the turn was built on
+        and ``version`` the one after it was saved. An entry at any other
+        version is missing a turn written elsewhere (another worker), so it is
+        dropped rather than marked current. No-op on a miss.
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        if entry.version != base_version:
+            self.invalidate(session_id)
+            return
+        entry.messages.extend(messages)
+        size = sum(_message_size(m) for m in messages)
+        entry.size += size
+        self._size += size
+        entry.version = version
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries.move_to_end(session_id)
+        if entry.size > self.max_chars:
+            self.invalidate(session_id)
+        self._evict()
+
+    def invalidate(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_sessions or self._size > self.max_chars):
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+
+history_cache = HistoryCache(
+    max_sessions=settings.HISTORY_CACHE_MAX_SESSIONS,
+    max_chars=settings.HISTORY_CACHE_MAX_CHARS,
+    ttl=settings.HISTORY_CACHE_TTL
+)
@@ -0,0 +1,97 @@
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Type
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+from app.config import settings
+import gzip
+import orjson
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it large responses are gzipped only
+    brotli = None
+
+@lru_cache(maxsize=None)
+def _field_defaults(model: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(
+        (name, None if field.is_required() else field.get_default(call_default_factory=True))
+        for name, field in model.model_fields.items()
+    )
+
+def trusted_row(row: Mapping[str, Any], model: Type[BaseModel]) -> Dict[str, Any]:
+    """Shape a database row like ``model`` without validating it.
+
+    For rows read straight from our own tables, whose types already match the
+    model: keeps only the model's fields and fills missing ones with their
+    defaults, so the JSON matches the documented response_model.
+    """
+    return {name: row.get(name, default) for name, default in _field_defaults(model)}
+
+def trusted_rows(rows: Iterable[Mapping[str, Any]], model: Type[BaseModel]) -> List[Dict[str, Any]]:
+    defaults = _field_defaults(model)
+    return [{name: row.get(name, default) for name, default in defaults} for row in rows]
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def encode_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+def _accepted_encodings(request: Request) -> Dict[str, float]:
+    encodings = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.lower()] = quality
+    return encodings
+
+def _compress(request: Request, body: bytes) -> Tuple[bytes, Optional[str]]:
+    accepted = _accepted_encodings(request)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY), "br"
+    if accepted.get("gzip", 0) > 0:
+        return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0), "gzip"
+    return body, None
+
+def json_bytes_response(
+    request: Request,
+    body: bytes,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Send already encoded JSON, compressing bodies over RESPONSE_COMPRESSION_MIN_SIZE"""
+    headers = dict(headers or {})
+    if settings.RESPONSE_COMPRESSION_ENABLED:
+        headers["Vary"] = "Accept-Encoding"
+        if len(body) >= settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            body, encoding = _compress(request, body)
+            if encoding:
+                headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+def fast_json_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Encode ``content`` with orjson and send it through json_bytes_response.
+
+    Returning this from an endpoint skips FastAPI's response_model validation
+    and encoding, so ``content`` must already have the response model's shape
+    (see trusted_row). The response_model still documents the endpoint.
+    """
+    return json_bytes_response(request, encode_json(content), status_code, headers)
@@ -0,0 +1,91 @@
+from typing import Any, Dict, Optional
+from app.config import settings
+import asyncio
+import httpx
+import jwt
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Placeholder secrets from config.py and .env.example mean "no project secret configured"
+_PLACEHOLDER_SECRETS = {"", "your-secret-key", "your_jwt_secret_key"}
+_SYMMETRIC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+_ASYMMETRIC_ALGORITHMS = {"RS256", "RS384", "RS512", "ES256", "ES384", "ES512", "EdDSA"}
+
+_jwks: Dict[str, Any] = {}
+_jwks_fetched_at: float = float("-inf")
+_jwks_attempted_at: float = float("-inf")  # Last fetch, successful or not
+_jwks_lock: Optional[asyncio.Lock] = None
+
+class LocalVerificationUnavailable(Exception):
+    """No key is configured to verify this token locally"""
+
+async def _fetch_jwks() -> None:
+    global _jwks, _jwks_fetched_at, _jwks_attempted_at
+    _jwks_attempted_at = time.monotonic()
+    url = f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
+    async with httpx.AsyncClient(timeout=settings.AUTH_JWKS_TIMEOUT) as client:
+        response = await client.get(url, headers={"apikey": settings.SUPABASE_SERVICE_ROLE_KEY})
+        response.raise_for_status()
+    keys = {}
+    for jwk in response.json().get("keys", []):
+        try:
+            keys[jwk.get("kid")] = jwt.PyJWK(jwk).key
+        except jwt.PyJWKError as e:
+            logger.warning(f"Skipping unusable JWKS key {jwk.get('kid')}: {e}")
+    _jwks = keys
+    _jwks_fetched_at = time.monotonic()
+    logger.info(f"Loaded {len(keys)} signing keys from JWKS")
+
+async def _get_public_key(kid: Optional[str]) -> Any:
+    """Return the cached signing key for kid, refetching the JWKS on expiry or rotation"""
+    global _jwks_lock
+    age = time.monotonic() - _jwks_fetched_at
+    if kid in _jwks and age < settings.AUTH_JWKS_TTL:
+        return _jwks[kid]
+    if _jwks_lock is None:
+        _jwks_lock = asyncio.Lock()
+    async with _jwks_lock:
+        now = time.monotonic()
+        age = now - _jwks_fetched_at
+        # Unknown kid means the keys may have rotated; refetch, but not more than once per
+        # interval, and no sooner after a failed fetch, so an outage is not hit per request
+        if (age >= settings.AUTH_JWKS_TTL or kid not in _jwks) and now - _jwks_attempted_at >= settings.AUTH_JWKS_MIN_REFRESH:
+            try:
+                await _fetch_jwks()
+            except Exception as e:
+                if kid not in _jwks:
+                    raise
+                logger.warning(f"JWKS refresh failed, keeping the cached keys: {e}")
+    if kid not in _jwks:
+        raise jwt.InvalidKeyError(f"No signing key found for kid {kid}")
+    return _jwks[kid]
+
+async def decode_access_token(token: str) -> Dict[str, Any]:
+    """Verify a Supabase access token locally and return its claims.
+
+    HS* tokens are checked against JWT_SECRET_KEY (the project's JWT secret);
+    asymmetric tokens against the project's cached JWKS. Raises a jwt.PyJWTError
+    if the signature, expiry or audience is invalid, and
+    LocalVerificationUnavailable if no key is configured for the token.
+    """
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    if algorithm in _SYMMETRIC_ALGORITHMS:
+        if settings.JWT_SECRET_KEY in _PLACEHOLDER_SECRETS:
+            raise LocalVerificationUnavailable("JWT_SECRET_KEY is not configured")
+        key = settings.JWT_SECRET_KEY
+    elif algorithm in _ASYMMETRIC_ALGORITHMS:
+        if not settings.SUPABASE_URL:
+            raise LocalVerificationUnavailable("SUPABASE_URL is not configured")
+        key = await _get_public_key(header.get("kid"))
+    else:
+        raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=settings.JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]}
+    )
@@ -0,0 +1,67 @@
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+import os
+
+# Buckets span fast PostgREST reads to long streamed completions
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status code",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", multiprocess_mode="livesum"
+)
+SUPABASE_QUERY_DURATION = Histogram(
+    "supabase_query_duration_seconds", "Supabase call latency by PostgREST path (or auth call) and method",
+    ["target", "method"], buckets=LATENCY_BUCKETS
+)
+OPENAI_REQUEST_DURATION = Histogram(
+    "openai_request_duration_seconds", "OpenAI chat completion latency by model and outcome",
+    ["model", "outcome"], buckets=LATENCY_BUCKETS
+)
+OPENAI_TIME_TO_FIRST_TOKEN = Histogram(
+    "openai_time_to_first_token_seconds", "Time to the first streamed completion delta by model",
+    ["model"], buckets=LATENCY_BUCKETS
+)
+MODEL_ROUTING_EVENTS = Counter(
+    "model_routing_events_total", "Hedged requests, hedge wins and fallbacks by requested model",
+    ["model", "event"]
+)
+SESSION_TURNS_WAITING = Gauge(
+    "chat_session_turns_waiting", "Chat turns waiting for an earlier turn on the same session to finish",
+    multiprocess_mode="livesum"
+)
+SESSION_TURN_QUEUE_DEPTH = Histogram(
+    "chat_session_turn_queue_depth", "Turns already queued or running on a session when a new turn arrives",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21)
+)
+SESSION_TURN_WAIT = Histogram(
+    "chat_session_turn_wait_seconds", "Time a chat turn waited for its session", buckets=LATENCY_BUCKETS
+)
+SESSION_TURN_TIMEOUTS = Counter(
+    "chat_session_turn_timeouts_total", "Chat turns rejected after waiting SESSION_LOCK_TIMEOUT for their session"
+)
+OPENAI_TOKENS = Counter(
+    "openai_tokens_total", "Tokens billed by OpenAI by model and kind (input/output)",
+    ["model", "kind"]
+)
+OPENAI_COST = Counter(
+    "openai_cost_usd_total", "Estimated OpenAI spend in USD by model",
+    ["model"]
+)
+
+def record_usage(model: str, input_tokens: int, output_tokens: int, cost: float) -> None:
+    OPENAI_TOKENS.labels(model, "input").inc(input_tokens)
+    OPENAI_TOKENS.labels(model, "output").inc(output_tokens)
+    OPENAI_COST.labels(model).inc(cost)
+
+def render_metrics() -> bytes:
+    """Exposition text; aggregates all workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
@@ -0,0 +1,237 @@
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.metrics import MODEL_ROUTING_EVENTS, OPENAI_REQUEST_DURATION
+from app.services.openai_client import get_openai_client
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency is tracked separately for full completions and for time to first streamed chunk
+COMPLETION = "completion"
+STREAM = "stream"
+
+def parse_fallbacks(value: str) -> Dict[str, str]:
+    """Parse "model:fallback,model:fallback" into a mapping"""
+    fallbacks = {}
+    for pair in value.split(","):
+        model, _, fallback = pair.strip().partition(":")
+        if model and fallback and model != fallback:
+            fallbacks[model] = fallback
+    return fallbacks
+
+class ModelHealth:
+    """Rolling window of call outcomes for one model"""
+
+    def __init__(self, window: float, max_samples: int = 1000):
+        self.window = window
+        self._samples: Deque[Tuple[float, str, float, bool]] = deque(maxlen=max_samples)
+
+    def record(self, kind: str, latency: float, ok: bool) -> None:
+        self._samples.append((time.monotonic(), kind, latency, ok))
+
+    def _recent(self) -> Deque[Tuple[float, str, float, bool]]:
+        cutoff = time.monotonic() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        return self._samples
+
+    def percentile(self, kind: str, pct: float, min_samples: int) -> Optional[float]:
+        latencies = sorted(latency for _, k, latency, ok in self._recent() if ok and k == kind)
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def error_rate(self, min_samples: int) -> Optional[float]:
+        samples = self._recent()
+        if len(samples) < min_samples:
+            return None
+        return sum(1 for *_, ok in samples if not ok) / len(samples)
+
+class ModelRouter:
+    """Routes chat completions by each model's recent latency and error rate.
+
+    A request still waiting after the model's recent p95 latency gets a hedged
+    duplicate and the first success wins. A model whose error rate or p95
+    latency stays over the limit is skipped in favour of its fallback until
+    its samples age out of the window, and a request that fails outright is
+    retried once on the fallback. Callers get back the model that answered.
+    """
+
+    def __init__(
+        self,
+        fallbacks: Dict[str, str],
+        window: float,
+        min_samples: int,
+        hedge_enabled: bool,
+        hedge_percentile: float,
+        hedge_min_delay: float,
+        error_rate: float,
+        latency_limit: float
+    ):
+        self.fallbacks = fallbacks
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.error_rate = error_rate
+        self.latency_limit = latency_limit
+        self._health: Dict[str, ModelHealth] = {}
+
+    def health(self, model: str) -> ModelHealth:
+        if model not in self._health:
+            self._health[model] = ModelHealth(self.window)
+        return self._health[model]
+
+    def hedge_delay(self, model: str, kind: str) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        p = self.health(model).percentile(kind, self.hedge_percentile, self.min_samples)
+        return None if p is None else max(p, self.hedge_min_delay)
+
+    def is_degraded(self, model: str) -> bool:
+        health = self.health(model)
+        rate = health.error_rate(self.min_samples)
+        if rate is not None and rate >= self.error_rate:
+            return True
+        if self.latency_limit:
+            p95 = health.percentile(COMPLETION, 95, self.min_samples)
+            if p95 is not None and p95 >= self.latency_limit:
+                return True
+        return False
+
+    def route(self, model: str) -> List[str]:
+        """Models to try in order: the requested one and its fallback, degraded ones last"""
+        fallback = self.fallbacks.get(model)
+        if not fallback:
+            return [model]
+        if self.is_degraded(model) and not self.is_degraded(fallback):
+            MODEL_ROUTING_EVENTS.labels(model, "fallback").inc()
+            return [fallback, model]
+        return [model, fallback]
+
+    async def _timed(self, model: str, kind: str, attempt: Callable[[str], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await attempt(model)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            elapsed = time.perf_counter() - started
+            self.health(model).record(kind, elapsed, False)
+            if kind == COMPLETION:
+                OPENAI_REQUEST_DURATION.labels(model, "error").observe(elapsed)
+            raise
+        elapsed = time.perf_counter() - started
+        self.health(model).record(kind, elapsed, True)
+        # A stream only returns here at its first chunk; its full duration is
+        # observed by the caller once the stream ends
+        if kind == COMPLETION:
+            OPENAI_REQUEST_DURATION.labels(model, "ok").observe(elapsed)
+        return result
+
+    async def _hedged(
+        self,
+        model: str,
+        kind: str,
+        attempt: Callable[[str], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]]
+    ) -> Any:
+        """Run attempt, adding one duplicate if it outlasts the hedge delay"""
+        tasks = [asyncio.create_task(self._timed(model, kind, attempt))]
+        winner = None
+        try:
+            delay = self.hedge_delay(model, kind)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    MODEL_ROUTING_EVENTS.labels(model, "hedge").inc()
+                    tasks.append(asyncio.create_task(self._timed(model, kind, attempt)))
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not tasks[0]:
+                            MODEL_ROUTING_EVENTS.labels(model, "hedge_won").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif discard and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+    async def _call(
+        self,
+        model: str,
+        kind: str,
+        attempt: Callable[[str], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None
+    ) -> Tuple[Any, str]:
+        candidates = self.route(model)
+        for i, candidate in enumerate(candidates):
+            try:
+                return await self._hedged(candidate, kind, attempt, discard), candidate
+            except Exception as e:
+                if i == len(candidates) - 1:
+                    raise
+                logger.warning(f"{candidate} failed, retrying on {candidates[i + 1]}: {e}")
+                MODEL_ROUTING_EVENTS.labels(model, "fallback").inc()
+
+    async def complete(self, model: str, **params: Any) -> Tuple[Any, str]:
+        """Chat completion routed from the requested model; returns (response, model used)"""
+        async def attempt(candidate: str):
+            return await get_openai_client().chat.completions.create(model=candidate, **params)
+        return await self._call(model, COMPLETION, attempt)
+
+    async def stream(self, model: str, **params: Any) -> Tuple[AsyncIterator[Any], str]:
+        """Streamed chat completion; hedging and fallback apply until the first chunk arrives.
+
+        Returns an iterator over all chunks (first included) and the model used.
+        """
+        async def attempt(candidate: str):
+            stream = await get_openai_client().chat.completions.create(model=candidate, stream=True, **params)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await stream.close()
+                raise
+            return stream, first
+
+        async def discard(opened) -> None:
+            await opened[0].close()
+
+        (stream, first), used = await self._call(model, STREAM, attempt, discard)
+
+        async def chunks():
+            try:
+                if first is not None:
+                    yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.close()
+        return chunks(), used
+
+model_router = ModelRouter(
+    fallbacks=parse_fallbacks(settings.MODEL_FALLBACKS),
+    window=settings.ROUTING_WINDOW,
+    min_samples=settings.ROUTING_MIN_SAMPLES,
+    hedge_enabled=settings.ROUTING_HEDGE_ENABLED,
+    hedge_percentile=settings.ROUTING_HEDGE_PERCENTILE,
+    hedge_min_delay=settings.ROUTING_HEDGE_MIN_DELAY,
+    error_rate=settings.ROUTING_ERROR_RATE,
+    latency_limit=settings.ROUTING_LATENCY_LIMIT
+)
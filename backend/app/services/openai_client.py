@@ -0,0 +1,46 @@
+from typing import Optional
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, Timeout
+from app.config import settings
+import httpx
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[AsyncOpenAI] = None
+
+def init_openai_client() -> Optional[AsyncOpenAI]:
+    """Create the shared async OpenAI client and its connection pool"""
+    global _client
+    if _client is not None:
+        return _client
+    if not os.environ.get("OPENAI_API_KEY"):
+        logger.warning("OPENAI_API_KEY is not set; chat completions are unavailable")
+        return None
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS
+        ),
+        timeout=Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+    )
+    _client = AsyncOpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=http_client
+    )
+    logger.info("OpenAI client created successfully")
+    return _client
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the shared async OpenAI client, creating it on first use"""
+    client = _client if _client is not None else init_openai_client()
+    if client is None:
+        raise ValueError("Missing OpenAI configuration")
+    return client
+
+async def close_openai_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,73 @@
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import json
+import re
+
+# Cursor parts end up inside a PostgREST filter string, so only allow plain values
+# (timestamps, and numbers including exponent notation)
+_SORT_VALUE_RE = re.compile(r"^[0-9T:.+\-eE ]{1,40}$")
+_ID_RE = re.compile(r"^[0-9A-Za-z\-]{1,64}$")
+
+def encode_cursor(sort_value: Any, row_id: Any) -> str:
+    raw = json.dumps([str(sort_value), str(row_id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not _SORT_VALUE_RE.match(sort_value) or not _ID_RE.match(row_id):
+        raise ValueError("Invalid cursor")
+    return sort_value, row_id
+
+def _keyset_filter(column: str, op: str, cursor: str) -> str:
+    sort_value, row_id = decode_cursor(cursor)
+    return f'{column}.{op}."{sort_value}",and({column}.eq."{sort_value}",id.{op}.{row_id})'
+
+def keyset_page(query, column: str, limit: int, before: Optional[str] = None, after: Optional[str] = None):
+    """Apply keyset pagination on (column, id) to a PostgREST select.
+
+    ``before`` pages towards older rows, ``after`` towards newer ones; with
+    neither the newest rows are returned. One extra row is fetched so
+    finish_page can tell whether another page exists. Raises ValueError for a
+    malformed cursor.
+    """
+    if before and after:
+        raise ValueError("Use either before or after, not both")
+    if after:
+        query = query.or_(_keyset_filter(column, "gt", after)).order(column).order("id")
+    else:
+        if before:
+            query = query.or_(_keyset_filter(column, "lt", before))
+        query = query.order(column, desc=True).order("id", desc=True)
+    return query.limit(limit + 1)
+
+def finish_page(
+    rows: List[Dict[str, Any]],
+    column: str,
+    limit: int,
+    after: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Trim a keyset_page result to newest-first rows plus the cursor for the next page.
+
+    The cursor continues in the direction requested: pass it back as
+    ``before`` or ``after``, whichever produced this page.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][column], rows[-1]["id"]) if has_more else None
+    if after:
+        rows.reverse()
+    return rows, next_cursor
+
+def keyset_scan(query, column: str, limit: int, after: Optional[str] = None):
+    """One page of a full oldest-first scan on (column, id), resuming after a cursor.
+
+    For exports and other bulk reads; build the next cursor with
+    encode_cursor from the last row of a full page.
+    """
+    if after:
+        query = query.or_(_keyset_filter(column, "gt", after))
+    return query.order(column).order("id").limit(limit)
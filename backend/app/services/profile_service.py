@@ -1,5 +1,6 @@
 from typing import Optional, Dict, Any
-from app.services.supabase_client import get_supabase_client
+from app.services.supabase_client import get_supabase_client, run_query
+from app.services.response_cache import profile_cache
 from app.models.schemas import Profile, ProfileUpdate
 import logging
 from datetime import datetime
@@ -10,9 +11,9 @@ async def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
     """Get user profile by ID"""
     try:
         supabase = get_supabase_client()
-        response = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
+        response = await run_query(supabase.table("profiles").select("*").eq("id", user_id).single())
         if response.data:
-            logger.info(f"Retrieved profile for user: {user_id}")
+            logger.debug("Retrieved profile for user: %s", user_id)
             return response.data
         else:
             logger.warning(f"No profile found for user: {user_id}")
@@ -30,7 +31,8 @@ async def update_user_profile(user_id: str, updates: ProfileUpdate) -> Dict[str,
             **updates.model_dump(exclude_unset=True),
             "updated_at": datetime.utcnow().isoformat()
         }
-        response = supabase.table("profiles").update(update_data).eq("id", user_id).execute()
+        response = await run_query(supabase.table("profiles").update(update_data).eq("id", user_id))
+        await profile_cache.invalidate([user_id])
         if response.data and len(response.data) > 0:
             logger.info(f"Updated profile for user: {user_id}")
             return response.data[0]
@@ -50,7 +52,7 @@ async def create_user_profile(user_id: str, display_name: Optional[str] = None)
             "created_at": datetime.utcnow().isoformat(),
             "updated_at": datetime.utcnow().isoformat()
         }
-        response = supabase.table("profiles").insert(profile_data).execute()
+        response = await run_query(supabase.table("profiles").insert(profile_data))
         if response.data and len(response.data) > 0:
             logger.info(f"Created profile for user: {user_id}")
             return response.data[0]
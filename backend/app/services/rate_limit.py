@@ -0,0 +1,212 @@
+from collections import OrderedDict
+from typing import Dict
+from app.config import settings
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+class RateLimitExceeded(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+class MemoryRateLimitBackend:
+    """Token buckets and in-flight counters for one worker process"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._slots: Dict[str, int] = {}
+
+    async def take(self, key: str, capacity: float, rate: float, amount: float) -> float:
+        """Take amount from the bucket (negative refunds); return seconds to wait, 0 if taken"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        wait = 0.0
+        if tokens >= amount:
+            tokens = min(capacity, tokens - amount)
+        else:
+            wait = (amount - tokens) / rate
+        self._buckets[key] = [tokens, now]
+        self._buckets.move_to_end(key)
+        # Dropping the least recently used bucket only resets it to full
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        count = self._slots.get(key, 0)
+        if count >= limit:
+            return False
+        self._slots[key] = count + 1
+        return True
+
+    async def release_slot(self, key: str) -> None:
+        count = self._slots.get(key, 0) - 1
+        if count > 0:
+            self._slots[key] = count
+        else:
+            self._slots.pop(key, None)
+
+_TAKE_SCRIPT = """
+local cap = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(state[1]) or cap
+local ts = tonumber(state[2]) or now
+tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= amount then
+    tokens = math.min(cap, tokens - amount)
+else
+    wait = (amount - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(cap / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisRateLimitBackend:
+    """Token buckets and in-flight counters shared by all workers through Redis"""
+
+    # In-flight counters expire so a crashed worker cannot hold slots forever
+    SLOT_TTL = 300
+
+    def __init__(self, url: str, namespace: str = "ratelimit"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis rate limit backend (pip install redis)")
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self.namespace = namespace
+
+    async def take(self, key: str, capacity: float, rate: float, amount: float) -> float:
+        wait = await self._take(keys=[f"{self.namespace}:{key}"], args=[capacity, rate, amount, time.time()])
+        return float(wait)
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        slot_key = f"{self.namespace}:slots:{key}"
+        count = await self._redis.incr(slot_key)
+        await self._redis.expire(slot_key, self.SLOT_TTL)
+        if count > limit:
+            await self._redis.decr(slot_key)
+            return False
+        return True
+
+    async def release_slot(self, key: str) -> None:
+        await self._redis.decr(f"{self.namespace}:slots:{key}")
+
+class CompletionLease:
+    """Concurrency slot plus token/cost reservations for one completion.
+
+    The reservation is based on an estimate; settle() corrects it with the
+    real usage and release() frees the slot, refunding the whole estimate if
+    the completion was never settled. release() is safe to call twice.
+    """
+
+    def __init__(self, limiter: "RateLimiter", key: str, tokens: float, cost: float, has_slot: bool):
+        self.limiter = limiter
+        self.key = key
+        self.tokens = tokens
+        self.cost = cost
+        self.has_slot = has_slot
+        self.settled = False
+
+    async def settle(self, tokens: int, cost: float) -> None:
+        if self.settled:
+            return
+        self.settled = True
+        await self.limiter._charge(self.key, tokens - self.tokens, cost - self.cost)
+
+    async def release(self) -> None:
+        if not self.settled:
+            await self.settle(0, 0.0)
+        if self.has_slot:
+            self.has_slot = False
+            await self.limiter.backend.release_slot(self.key)
+
+class RateLimiter:
+    """Per-client limits for chat completions; a limit of 0 disables it.
+
+    - request rate: RATE_LIMIT_RPS with bursts of RATE_LIMIT_BURST
+    - concurrent completions: RATE_LIMIT_MAX_CONCURRENT
+    - estimated tokens per minute: RATE_LIMIT_TOKENS_PER_MINUTE
+    - estimated spend per day (USD): RATE_LIMIT_COST_PER_DAY
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def check_request(self, key: str) -> None:
+        if not settings.RATE_LIMIT_ENABLED or settings.RATE_LIMIT_RPS <= 0:
+            return
+        burst = max(1.0, settings.RATE_LIMIT_BURST)
+        wait = await self.backend.take(f"rps:{key}", burst, settings.RATE_LIMIT_RPS, 1)
+        if wait:
+            raise RateLimitExceeded("Too many requests", wait)
+
+    async def acquire_completion(self, key: str, tokens: int, cost: float) -> CompletionLease:
+        if not settings.RATE_LIMIT_ENABLED:
+            return CompletionLease(self, key, 0, 0.0, has_slot=False)
+        has_slot = False
+        if settings.RATE_LIMIT_MAX_CONCURRENT > 0:
+            if not await self.backend.acquire_slot(key, settings.RATE_LIMIT_MAX_CONCURRENT):
+                raise RateLimitExceeded("Too many concurrent completions", 1)
+            has_slot = True
+        try:
+            await self._reserve(key, tokens, cost)
+        except RateLimitExceeded:
+            if has_slot:
+                await self.backend.release_slot(key)
+            raise
+        return CompletionLease(self, key, tokens, cost, has_slot)
+
+    async def _reserve(self, key: str, tokens: float, cost: float) -> None:
+        tpm = settings.RATE_LIMIT_TOKENS_PER_MINUTE
+        daily = settings.RATE_LIMIT_COST_PER_DAY
+        if tpm > 0:
+            # A request larger than the whole bucket would otherwise never be admitted
+            wait = await self.backend.take(f"tpm:{key}", tpm, tpm / 60, min(tokens, tpm))
+            if wait:
+                raise RateLimitExceeded("Token rate limit exceeded", wait)
+        if daily > 0:
+            wait = await self.backend.take(f"cost:{key}", daily, daily / 86400, min(cost, daily))
+            if wait:
+                if tpm > 0:
+                    await self.backend.take(f"tpm:{key}", tpm, tpm / 60, -min(tokens, tpm))
+                raise RateLimitExceeded("Daily cost budget exceeded", wait)
+
+    async def _charge(self, key: str, tokens: float, cost: float) -> None:
+        """Adjust reservations by a delta; negative values refund, overdraft is not checked"""
+        tpm = settings.RATE_LIMIT_TOKENS_PER_MINUTE
+        daily = settings.RATE_LIMIT_COST_PER_DAY
+        try:
+            if tpm > 0 and tokens:
+                await self._force_take(f"tpm:{key}", tpm, tpm / 60, tokens)
+            if daily > 0 and cost:
+                await self._force_take(f"cost:{key}", daily, daily / 86400, cost)
+        except Exception as e:
+            logger.warning(f"Rate limit settlement failed for {key}: {e}")
+
+    async def _force_take(self, bucket: str, capacity: float, rate: float, amount: float) -> None:
+        # A charge beyond what is left just empties the bucket
+        wait = await self.backend.take(bucket, capacity, rate, amount)
+        if wait:
+            await self.backend.take(bucket, capacity, rate, amount - wait * rate)
+
+def retry_after_header(retry_after: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+def _create_backend():
+    if settings.CACHE_BACKEND == "redis":
+        return RedisRateLimitBackend(settings.REDIS_URL)
+    return MemoryRateLimitBackend()
+
+rate_limiter = RateLimiter(_create_backend())
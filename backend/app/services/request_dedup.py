@@ -0,0 +1,45 @@
+from typing import Any, Awaitable, Callable, Dict
+from app.config import settings
+from app.services.cache_backends import create_cache_backend
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller starts the work as a task; callers arriving while it runs
+    await the same task and get the same result or exception. The task is
+    shielded, so a caller disconnecting does not cancel the work for the
+    others. Keys are per process.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+chat_single_flight = SingleFlight()
+
+# Responses stored per Idempotency-Key, replayed for retries within IDEMPOTENCY_TTL
+idempotency_store = create_cache_backend("idempotency", settings.IDEMPOTENCY_MAX_ENTRIES)
@@ -0,0 +1,100 @@
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+from starlette.requests import Request
+from starlette.responses import Response
+from app.config import settings
+from app.services.cache_backends import MemoryCacheBackend
+from app.services.json_response import json_bytes_response
+import hashlib
+import time
+
+# Clients may reuse a stored copy but must revalidate it with If-None-Match first
+CACHE_CONTROL = "private, no-cache"
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+def weak_etag(*parts: Any) -> str:
+    """Weak validator over the fields that change with a resource (its updated_at and id)"""
+    digest = hashlib.sha1("\0".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check with weak comparison (RFC 9110 section 13.1.2)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+def conditional_response(request: Request, cached: CachedResponse) -> Response:
+    """304 with no body when the client already holds this version, else the full body"""
+    headers = {**cached.headers, "ETag": cached.etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request, cached.etag):
+        if settings.RESPONSE_COMPRESSION_ENABLED:
+            headers["Vary"] = "Accept-Encoding"
+        return Response(status_code=304, headers=headers)
+    return json_bytes_response(request, cached.body, headers=headers)
+
+class ResponseCache:
+    """Short-lived in-process cache of encoded JSON responses, grouped by owner.
+
+    An owner (a user id) can hold several variants of one resource, e.g. pages
+    of a listing; invalidating the owner drops all of them, so writers need not
+    know which variants were read. Per worker, so another worker's write is
+    seen once the TTL expires; keep the TTL to a few seconds.
+    """
+
+    def __init__(self, enabled: bool, max_owners: int, ttl: float):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._backend = MemoryCacheBackend(max_owners)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, owner: str, variant: str = "") -> Optional[CachedResponse]:
+        if not self.enabled:
+            return None
+        variants = await self._backend.get(owner)
+        item = variants.get(variant) if variants else None
+        if item is None or item[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return item[1]
+
+    async def set(self, owner: str, cached: CachedResponse, variant: str = "") -> None:
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        variants = await self._backend.get(owner) or {}
+        # Drop expired variants while we are here so an owner's entry cannot grow unbounded
+        variants = {k: v for k, v in variants.items() if v[0] >= now}
+        variants[variant] = (now + self.ttl, cached)
+        await self._backend.set(owner, variants, self.ttl)
+
+    async def invalidate(self, owners: Iterable[str]) -> None:
+        for owner in owners:
+            await self._backend.delete(owner)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def session_owner(user_id: Optional[str]) -> str:
+    """Cache owner for a user's sessions; anonymous sessions are shared by all anonymous callers"""
+    return user_id or "anonymous"
+
+profile_cache = ResponseCache(
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+    max_owners=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=settings.RESPONSE_CACHE_TTL
+)
+session_list_cache = ResponseCache(
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+    max_owners=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=settings.RESPONSE_CACHE_TTL
+)
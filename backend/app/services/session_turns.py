@@ -0,0 +1,239 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+from app.config import settings
+from app.services.metrics import SESSION_TURN_QUEUE_DEPTH, SESSION_TURN_TIMEOUTS, SESSION_TURN_WAIT, SESSION_TURNS_WAITING
+import asyncio
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+class SessionBusy(Exception):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+class MemorySessionTurnBackend:
+    """FIFO turn queue per session for one worker process (asyncio.Lock wakes waiters in order)"""
+
+    def __init__(self):
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    async def acquire(self, session_id: str, token: str, timeout: float) -> bool:
+        lock, users = self._locks.get(session_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[session_id] = (lock, users + 1)
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._forget(session_id)
+            return False
+        except BaseException:
+            self._forget(session_id)
+            raise
+
+    async def release(self, session_id: str, token: str) -> None:
+        entry = self._locks.get(session_id)
+        if entry is None:
+            return
+        entry[0].release()
+        self._forget(session_id)
+
+    async def depth(self, session_id: str) -> int:
+        return self._locks.get(session_id, (None, 0))[1]
+
+    def _forget(self, session_id: str) -> None:
+        lock, users = self._locks[session_id]
+        if users > 1:
+            self._locks[session_id] = (lock, users - 1)
+        else:
+            del self._locks[session_id]
+
+# Pops queue heads whose owner stopped refreshing its lease (a crashed worker),
+# then reports whether ARGV[1] is at the head: 1 yes, 0 waiting, -1 not queued.
+_HEAD_SCRIPT = """
+while true do
+    local head = redis.call('LINDEX', KEYS[1], 0)
+    if not head then
+        return -1
+    end
+    if head == ARGV[1] then
+        return 1
+    end
+    if redis.call('EXISTS', ARGV[2] .. head) == 1 then
+        if redis.call('LPOS', KEYS[1], ARGV[1]) then
+            return 0
+        end
+        return -1
+    end
+    redis.call('LPOP', KEYS[1])
+end
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('LINDEX', KEYS[1], 0) == ARGV[1] then
+    redis.call('LPOP', KEYS[1])
+else
+    redis.call('LREM', KEYS[1], 0, ARGV[1])
+end
+redis.call('DEL', KEYS[2])
+"""
+
+class RedisSessionTurnBackend:
+    """FIFO turn queue per session shared by all workers through Redis.
+
+    Each session has a Redis list of turn tokens; the head holds the turn.
+    Every queued token has a lease key that its worker refreshes while it
+    waits or holds the turn, so the queue moves on past a crashed worker once
+    SESSION_LOCK_LEASE expires. Waiters poll the head, backing off to
+    POLL_MAX between checks.
+    """
+
+    POLL_MIN = 0.01
+    POLL_MAX = 0.2
+
+    def __init__(self, url: str, lease: float, namespace: str = "turns"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis session turn backend (pip install redis)")
+        self._redis = redis.from_url(url)
+        self._head = self._redis.register_script(_HEAD_SCRIPT)
+        self._release = self._redis.register_script(_RELEASE_SCRIPT)
+        self.lease_ms = int(lease * 1000)
+        self.namespace = namespace
+        self._renewers: Dict[str, asyncio.Task] = {}
+
+    def _queue_key(self, session_id: str) -> str:
+        return f"{self.namespace}:{session_id}"
+
+    def _lease_key(self, token: str) -> str:
+        return f"{self.namespace}:lease:{token}"
+
+    async def _enqueue(self, queue: str, token: str) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._lease_key(token), 1, px=self.lease_ms)
+            pipe.rpush(queue, token)
+            pipe.pexpire(queue, self.lease_ms * 2)
+            await pipe.execute()
+
+    async def acquire(self, session_id: str, token: str, timeout: float) -> bool:
+        queue = self._queue_key(session_id)
+        deadline = time.monotonic() + timeout
+        delay = self.POLL_MIN
+        await self._enqueue(queue, token)
+        try:
+            while True:
+                await self._redis.pexpire(self._lease_key(token), self.lease_ms)
+                state = int(await self._head(keys=[queue], args=[token, f"{self.namespace}:lease:"]))
+                if state == 1:
+                    self._renewers[token] = asyncio.create_task(self._renew(queue, token))
+                    return True
+                if state == -1:
+                    # Dropped as stale after a stall; rejoin at the back
+                    await self._enqueue(queue, token)
+                if time.monotonic() + delay > deadline:
+                    await self._release(keys=[queue, self._lease_key(token)], args=[token])
+                    return False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.POLL_MAX)
+        except BaseException:
+            await asyncio.shield(self._release(keys=[queue, self._lease_key(token)], args=[token]))
+            raise
+
+    async def _renew(self, queue: str, token: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_ms / 3000)
+            try:
+                await self._redis.pexpire(self._lease_key(token), self.lease_ms)
+                await self._redis.pexpire(queue, self.lease_ms * 2)
+            except Exception as e:
+                logger.warning(f"Session turn lease renewal failed: {e}")
+
+    async def release(self, session_id: str, token: str) -> None:
+        renewer = self._renewers.pop(token, None)
+        if renewer is not None:
+            renewer.cancel()
+        await self._release(keys=[self._queue_key(session_id), self._lease_key(token)], args=[token])
+
+    async def depth(self, session_id: str) -> int:
+        return int(await self._redis.llen(self._queue_key(session_id)))
+
+class SessionTurn:
+    """A held turn on one session; release() is safe to call twice"""
+
+    def __init__(self, backend, session_id: str, token: Optional[str]):
+        self.backend = backend
+        self.session_id = session_id
+        self.token = token
+
+    def handoff(self) -> "SessionTurn":
+        """Move the hold to a new owner, e.g. a background task; release() here becomes a no-op"""
+        token, self.token = self.token, None
+        return SessionTurn(self.backend, self.session_id, token)
+
+    async def release(self) -> None:
+        if self.token is None:
+            return
+        token, self.token = self.token, None
+        try:
+            await self.backend.release(self.session_id, token)
+        except Exception as e:
+            logger.warning(f"Releasing the turn on session {self.session_id} failed: {e}")
+
+class SessionTurns:
+    """Runs the chat turns of one session one at a time, in arrival order.
+
+    A turn holds its session from reading the history until its reply is
+    saved, so concurrent sends cannot build on the same history or save out
+    of order. Different sessions never wait on each other. A turn that waits
+    longer than SESSION_LOCK_TIMEOUT gets SessionBusy.
+    """
+
+    def __init__(self, backend, enabled: bool, timeout: float):
+        self.backend = backend
+        self.enabled = enabled
+        self.timeout = timeout
+
+    async def acquire(self, session_id: str) -> SessionTurn:
+        if not self.enabled:
+            return SessionTurn(self.backend, session_id, None)
+        token = uuid.uuid4().hex
+        try:
+            SESSION_TURN_QUEUE_DEPTH.observe(await self.backend.depth(session_id))
+        except Exception as e:
+            logger.warning(f"Session turn queue depth unavailable: {e}")
+        SESSION_TURNS_WAITING.inc()
+        started = time.perf_counter()
+        try:
+            acquired = await self.backend.acquire(session_id, token, self.timeout)
+        finally:
+            SESSION_TURNS_WAITING.dec()
+            SESSION_TURN_WAIT.observe(time.perf_counter() - started)
+        if not acquired:
+            SESSION_TURN_TIMEOUTS.inc()
+            raise SessionBusy("Another message in this session is still being answered", 1)
+        return SessionTurn(self.backend, session_id, token)
+
+    @asynccontextmanager
+    async def turn(self, session_id: str) -> AsyncIterator[SessionTurn]:
+        held = await self.acquire(session_id)
+        try:
+            yield held
+        finally:
+            await held.release()
+
+def _create_backend():
+    if settings.CACHE_BACKEND == "redis":
+        return RedisSessionTurnBackend(settings.REDIS_URL, settings.SESSION_LOCK_LEASE)
+    return MemorySessionTurnBackend()
+
+session_turns = SessionTurns(
+    _create_backend(),
+    enabled=settings.SESSION_LOCK_ENABLED,
+    timeout=settings.SESSION_LOCK_TIMEOUT
+)
@@ -1,19 +1,85 @@
-from supabase import create_client, Client
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from supabase import create_client, Client, ClientOptions
 from app.config import settings
+from app.services.metrics import SUPABASE_QUERY_DURATION
+import asyncio
+import functools
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-def get_supabase_client() -> Client:
+_client: Optional[Client] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+def create_supabase_client() -> Client:
+    """Create a new, unshared Supabase client.
+
+    Use this for auth flows that sign a user in (login, signup, refresh,
+    password reset): those store the user's session on the client and switch
+    its database requests to that user's token, so they must never run on the
+    shared service-role client.
+    """
     try:
         if not settings.SUPABASE_URL or not settings.SUPABASE_SERVICE_ROLE_KEY:
             raise ValueError("Missing Supabase configuration")
         supabase: Client = create_client(
             settings.SUPABASE_URL,
-            settings.SUPABASE_SERVICE_ROLE_KEY
+            settings.SUPABASE_SERVICE_ROLE_KEY,
+            options=ClientOptions(
+                auto_refresh_token=False,
+                persist_session=False,
+                postgrest_client_timeout=settings.SUPABASE_TIMEOUT
+            )
         )
         logger.info("Supabase client created successfully")
         return supabase
     except Exception as e:
         logger.error(f"Failed to create Supabase client: {e}")
-        raise 
\ No newline at end of file
+        raise
+
+def init_supabase_client() -> Client:
+    """Create the process-wide Supabase client and its query thread pool"""
+    global _client, _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.SUPABASE_MAX_WORKERS,
+            thread_name_prefix="supabase"
+        )
+    if _client is None:
+        _client = create_supabase_client()
+    return _client
+
+def get_supabase_client() -> Client:
+    """Return the shared Supabase client, creating it on first use"""
+    return _client if _client is not None else init_supabase_client()
+
+def close_supabase_client() -> None:
+    global _client, _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    _client = None
+
+async def _run_in_executor(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    if _executor is None:
+        init_supabase_client()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def run_sync(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking Supabase call on the query thread pool"""
+    start = time.perf_counter()
+    try:
+        return await _run_in_executor(func, *args, **kwargs)
+    finally:
+        SUPABASE_QUERY_DURATION.labels(func.__qualname__, "call").observe(time.perf_counter() - start)
+
+async def run_query(query: Any) -> Any:
+    """Execute a PostgREST query builder without blocking the event loop"""
+    start = time.perf_counter()
+    try:
+        return await _run_in_executor(query.execute)
+    finally:
+        SUPABASE_QUERY_DURATION.labels(query.path, query.http_method).observe(time.perf_counter() - start)
@@ -1,21 +1,29 @@
-from typing import List, Optional
-from app.services.supabase_client import get_supabase_client
+from typing import List, Optional, Tuple
+from app.services.supabase_client import get_supabase_client, run_query
 from app.models.schemas import User
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def get_all_users() -> List[dict]:
-    """Get all users from the users table"""
+async def get_users_page(
+    limit: int,
+    offset: int = 0,
+    columns: str = "*",
+    count: Optional[str] = "exact"
+) -> Tuple[List[dict], Optional[int]]:
+    """Get one page of users and the table row count.
+
+    Slicing and counting happen in the database; count is "exact",
+    "planned" or "estimated" (the latter two read planner statistics and stay
+    cheap on large tables), or None to skip counting.
+    """
     try:
         supabase = get_supabase_client()
-        response = supabase.table('users').select('*').execute()
-        if response.data:
-            logger.info(f"Retrieved {len(response.data)} users")
-            return response.data
-        else:
-            logger.warning("No users found")
-            return []
+        query = supabase.table('users').select(columns, count=count).order('id').range(offset, offset + limit - 1)
+        response = await run_query(query)
+        users = response.data or []
+        logger.debug("Retrieved %d users at offset %d", len(users), offset)
+        return users, response.count
     except Exception as e:
         logger.error(f"Error fetching users: {e}")
         raise
@@ -24,9 +32,9 @@ async def get_user_by_id(user_id: str) -> Optional[dict]:
     """Get a specific user by ID"""
     try:
         supabase = get_supabase_client()
-        response = supabase.table('users').select('*').eq('id', user_id).single().execute()
+        response = await run_query(supabase.table('users').select('*').eq('id', user_id).single())
         if response.data:
-            logger.info(f"Retrieved user: {user_id}")
+            logger.debug("Retrieved user: %s", user_id)
             return response.data
         else:
             logger.warning(f"User not found: {user_id}")
@@ -0,0 +1,107 @@
+"""Micro-benchmark the JSON response paths for a session transcript.
+
+Usage (from backend/):
+    python -m benchmarks.bench_json
+    python -m benchmarks.bench_json --messages 50 500 2000 --repeat 50
+
+Compares, per transcript size, the previous get_session path (build the
+pydantic models, let FastAPI validate them against response_model, encode
+with the standard library) with fast_json_response over trusted rows, and
+reports what gzip and brotli (if installed) cost and save on top.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+import argparse
+import asyncio
+import gzip
+import statistics
+import time
+import uuid
+
+from fastapi.routing import serialize_response
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_model_field
+
+from app.config import settings
+from app.routers.chat import ChatMessage, ChatSession, ChatSessionWithMessages
+from app.services.json_response import brotli, encode_json, trusted_row, trusted_rows
+
+WORDS = "the quick brown fox jumps over the lazy dog while the model explains its reasoning".split()
+
+def make_rows(count: int, words_per_message: int = 80) -> Dict[str, Any]:
+    """A session row and its messages as PostgREST returns them"""
+    started = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    session_id = str(uuid.uuid4())
+    user_id = str(uuid.uuid4())
+    session = {
+        "id": session_id, "user_id": user_id, "title": "Benchmark session", "model": "gpt-4",
+        "created_at": started.isoformat(), "updated_at": (started + timedelta(minutes=count)).isoformat(),
+        "total_tokens": count * 120, "total_cost": round(count * 0.0042, 6)
+    }
+    messages = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({
+            "id": str(uuid.uuid4()), "session_id": session_id, "user_id": user_id if role == "user" else None,
+            "role": role, "content": " ".join(WORDS[(i + j) % len(WORDS)] for j in range(words_per_message)),
+            "created_at": (started + timedelta(seconds=30 * i)).isoformat(), "tokens": 100 + i % 40,
+            "cost": 0.0 if role == "user" else 0.0061, "model": None if role == "user" else "gpt-4",
+            "saved_tokens": 0, "saved_cost": 0
+        })
+    return {"session": session, "messages": messages}
+
+RESPONSE_FIELD = create_model_field(name="Response_get_session", type_=ChatSessionWithMessages, mode="serialization")
+LOOP = asyncio.new_event_loop()
+
+def model_path(rows: Dict[str, Any]) -> bytes:
+    messages = [ChatMessage(**m) for m in rows["messages"]]
+    content = ChatSessionWithMessages(**rows["session"], messages=messages)
+    serialized = LOOP.run_until_complete(serialize_response(field=RESPONSE_FIELD, response_content=content))
+    return JSONResponse(serialized).body
+
+def fast_path(rows: Dict[str, Any]) -> bytes:
+    body = trusted_row(rows["session"], ChatSession)
+    body["messages"] = trusted_rows(rows["messages"], ChatMessage)
+    return encode_json(body)
+
+def timed(fn: Callable[[], Any], repeat: int) -> float:
+    """Median seconds per call"""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def run(sizes: List[int], repeat: int) -> None:
+    header = (f"{'messages':>9}{'bytes':>10}{'model ms':>10}{'fast ms':>9}{'speedup':>9}"
+              f"{'gzip ms':>9}{'gzip %':>8}{'br ms':>8}{'br %':>7}")
+    print(header)
+    print("-" * len(header))
+    for size in sizes:
+        rows = make_rows(size)
+        body = fast_path(rows)
+        model_s = timed(lambda: model_path(rows), repeat)
+        fast_s = timed(lambda: fast_path(rows), repeat)
+        gzip_s = timed(lambda: gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0), repeat)
+        gzip_pct = 100 * len(gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL)) / len(body)
+        if brotli is not None:
+            br_s = timed(lambda: brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY), repeat)
+            br = f"{br_s * 1000:>8.2f}{100 * len(brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)) / len(body):>7.1f}"
+        else:
+            br = f"{'n/a':>8}{'n/a':>7}"
+        print(
+            f"{size:>9}{len(body):>10}{model_s * 1000:>10.2f}{fast_s * 1000:>9.2f}{model_s / fast_s:>8.1f}x"
+            f"{gzip_s * 1000:>9.2f}{gzip_pct:>8.1f}{br}"
+        )
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Compare the model and fast JSON response paths")
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 500, 2000], help="transcript sizes")
+    parser.add_argument("--repeat", type=int, default=30, help="timed runs per size (median is reported)")
+    args = parser.parse_args(argv)
+    run(args.messages, args.repeat)
+
+if __name__ == "__main__":
+    main()
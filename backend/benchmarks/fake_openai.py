@@ -0,0 +1,99 @@
+"""Stand-in for the OpenAI chat completions API.
+
+Serves POST /v1/chat/completions in both the plain and the SSE streaming
+form (including the final usage chunk requested via stream_options), with
+a configurable time to first token, per-token delay and reply length.
+Per-model overrides of the time to first token and an error rate make one
+model slow or flaky, to exercise hedging and fallback.
+"""
+from collections import Counter
+from typing import Dict, Optional
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+import asyncio
+import json
+import random
+import time
+import uuid
+
+WORDS = ("circuit", "current", "voltage", "resistor", "ground", "signal", "node", "loop", "phase", "load")
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        ttft: float = 0.2,
+        token_delay: float = 0.01,
+        reply_tokens: int = 60,
+        model_ttft: Optional[Dict[str, float]] = None,
+        error_rates: Optional[Dict[str, float]] = None
+    ):
+        self.ttft = ttft
+        self.model_ttft = model_ttft or {}
+        self.error_rates = error_rates or {}
+        self.token_delay = token_delay
+        self.reply_tokens = reply_tokens
+        self.requests: Counter = Counter()
+        self.app = Starlette(routes=[Route("/v1/chat/completions", self.completions, methods=["POST"])])
+
+    def _reply(self) -> list:
+        return [("" if i == 0 else " ") + WORDS[i % len(WORDS)] for i in range(self.reply_tokens)]
+
+    @staticmethod
+    def _prompt_tokens(body: dict) -> int:
+        return sum(len(str(m.get("content", ""))) // 4 + 4 for m in body.get("messages", [])) + 3
+
+    async def completions(self, request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-3.5-turbo")
+        ttft = self.model_ttft.get(model, self.ttft)
+        if random.random() < self.error_rates.get(model, 0.0):
+            self.requests["error"] += 1
+            await asyncio.sleep(ttft)
+            return JSONResponse(
+                {"error": {"message": "The server had an error while processing your request.", "type": "server_error"}},
+                status_code=500
+            )
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        pieces = self._reply()
+        usage = {
+            "prompt_tokens": self._prompt_tokens(body),
+            "completion_tokens": len(pieces),
+            "total_tokens": self._prompt_tokens(body) + len(pieces),
+        }
+        if not body.get("stream"):
+            self.requests["completion"] += 1
+            await asyncio.sleep(ttft + self.token_delay * len(pieces))
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(pieces)}}],
+                "usage": usage,
+            })
+
+        self.requests["stream"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            payload = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            await asyncio.sleep(ttft)
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                yield chunk({"content": piece})
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+            yield chunk({}, "stop")
+            if include_usage:
+                yield chunk(None, usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,365 @@
+"""In-memory stand-in for the Supabase REST (PostgREST) and Auth APIs.
+
+Implements just enough of PostgREST for the backend's queries: column
+filters (eq/neq/lt/lte/gt/gte/is/in), or=(...) trees, order, limit/offset,
+select projection, count preferences, single-object responses, and the
+RPC functions from supabase/migrations.
+Every request sleeps for the configured latency and is counted, so the
+benchmark can report database round trips per operation.
+"""
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+import asyncio
+import json
+import random
+import re
+import uuid
+import jwt
+
+# Embedded resources: (table, embedded table) -> (column, embedded column), one-to-one
+EMBEDS = {("chat_sessions", "chat_session_summaries"): ("id", "session_id")}
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+def _norm_ts(value: Any) -> Any:
+    """Normalise timestamps the way Postgres would (UTC, microseconds)"""
+    if not isinstance(value, str) or value == "now()":
+        return _now() if value == "now()" else value
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return value
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+def _unquote(value: str) -> str:
+    return value[1:-1] if len(value) >= 2 and value[0] == value[-1] == '"' else value
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, []
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+def _compare(row_value: Any, op: str, raw: str, column: str) -> bool:
+    if op == "is":
+        expected = {"null": None, "true": True, "false": False}[raw]
+        return row_value is expected
+    if op == "in":
+        options = [_unquote(v) for v in _split_top_level(raw.strip("()"))]
+        return str(row_value) in options
+    value = _unquote(raw)
+    if row_value is None:
+        return False
+    if column.endswith("_at"):
+        value = _norm_ts(value)
+    elif isinstance(row_value, (int, float)) and not isinstance(row_value, bool):
+        value = float(value)
+    else:
+        row_value = str(row_value)
+    return {
+        "eq": row_value == value,
+        "neq": row_value != value,
+        "lt": row_value < value,
+        "lte": row_value <= value,
+        "gt": row_value > value,
+        "gte": row_value >= value,
+    }[op]
+
+def _condition(expr: str):
+    """Parse `col.op.value`, `and(...)` or `or(...)` into a row predicate"""
+    for logic in ("and", "or"):
+        if expr.startswith(logic + "("):
+            children = [_condition(c) for c in _split_top_level(expr[len(logic) + 1:-1])]
+            combine = all if logic == "and" else any
+            return lambda row, children=children, combine=combine: combine(c(row) for c in children)
+    column, op, raw = expr.split(".", 2)
+    return lambda row: _compare(row.get(column), op, raw, column)
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, jwt_secret: str = ""):
+        self.latency = latency
+        self.jitter = jitter
+        self.jwt_secret = jwt_secret
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.round_trips: Counter = Counter()
+        self.app = Starlette(routes=[
+            Route("/rest/v1/rpc/{function}", self.rpc, methods=["POST"]),
+            Route("/rest/v1/{table}", self.table, methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+            Route("/auth/v1/user", self.auth_user, methods=["GET"]),
+        ])
+
+    async def _delay(self, kind: str) -> None:
+        self.round_trips[kind] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    # --- PostgREST tables ---
+    def _filtered(self, table: str, params) -> List[Dict[str, Any]]:
+        predicates = []
+        for key, value in params.multi_items():
+            if key in ("select", "order", "limit", "offset", "columns", "on_conflict"):
+                continue
+            if key in ("or", "and"):
+                predicates.append(_condition(f"{key}{value}"))
+            else:
+                op, raw = value.split(".", 1)
+                predicates.append(lambda row, c=key, o=op, r=raw: _compare(row.get(c), o, r, c))
+        return [row for row in self.tables.setdefault(table, []) if all(p(row) for p in predicates)]
+
+    @staticmethod
+    def _ordered(rows: List[Dict[str, Any]], order: Optional[str]) -> List[Dict[str, Any]]:
+        if not order:
+            return rows
+        for term in reversed(order.split(",")):
+            column, _, direction = term.partition(".")
+            descending = direction.startswith("desc")
+            rows = sorted(rows, key=lambda r: (r.get(column) is None, r.get(column) or ""), reverse=descending)
+        return rows
+
+    def _project(self, table: str, rows: List[Dict[str, Any]], select: Optional[str]) -> List[Dict[str, Any]]:
+        if not select or select == "*":
+            return rows
+        projected = []
+        for row in rows:
+            out = {}
+            for item in _split_top_level(select):
+                if item == "*":
+                    out.update(row)
+                elif "(" in item:
+                    embedded, columns = item[:-1].split("(", 1)
+                    column, embedded_column = EMBEDS[(table, embedded)]
+                    match = next((e for e in self.tables.get(embedded, []) if e[embedded_column] == row[column]), None)
+                    out[embedded] = self._project(embedded, [match], columns)[0] if match else None
+                else:
+                    out[item] = row.get(item)
+            projected.append(out)
+        return projected
+
+    def _respond(self, request: Request, rows: List[Dict[str, Any]], status: int = 200,
+                 total: Optional[int] = None, content_range: Optional[Tuple[int, int]] = None) -> Response:
+        headers = {}
+        if "count=" in request.headers.get("prefer", ""):
+            start, end = content_range or (0, len(rows) - 1)
+            headers["content-range"] = f"{start}-{end}/{total if total is not None else len(rows)}"
+        if request.method == "HEAD":
+            return Response(status_code=status, headers=headers)
+        if request.headers.get("accept") == "application/vnd.pgrst.object+json":
+            if len(rows) != 1:
+                return JSONResponse(
+                    {"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                     "details": f"The result contains {len(rows)} rows", "hint": None},
+                    status_code=406
+                )
+            return JSONResponse(rows[0], status_code=status, headers=headers)
+        return JSONResponse(rows, status_code=status, headers=headers)
+
+    async def table(self, request: Request) -> Response:
+        await self._delay("rest")
+        table = request.path_params["table"]
+        params = request.query_params
+        if request.method in ("GET", "HEAD"):
+            rows = self._ordered(self._filtered(table, params), params.get("order"))
+            total = len(rows)
+            offset = int(params.get("offset", 0))
+            limit = int(params["limit"]) if "limit" in params else None
+            rows = rows[offset:offset + limit if limit is not None else None]
+            return self._respond(request, self._project(table, rows, params.get("select")), total=total,
+                                 content_range=(offset, offset + len(rows) - 1))
+        if request.method == "POST":
+            body = await request.json()
+            created = [self._insert(table, item) for item in (body if isinstance(body, list) else [body])]
+            return self._respond(request, created, status=201)
+        rows = self._filtered(table, params)
+        if request.method == "PATCH":
+            changes = {k: (_norm_ts(v) if k.endswith("_at") else v) for k, v in (await request.json()).items()}
+            for row in rows:
+                row.update(changes)
+            return self._respond(request, rows)
+        ids = {id(r) for r in rows}
+        self.tables[table] = [r for r in self.tables[table] if id(r) not in ids]
+        return self._respond(request, rows)
+
+    def _insert(self, table: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        row = {"id": str(uuid.uuid4()), "created_at": _now()}
+        row.update({k: (_norm_ts(v) if k.endswith("_at") else v) for k, v in item.items()})
+        if table == "chat_messages":
+            # The chat_messages_set_user_id trigger stamps every message with the session owner
+            sessions = [s for s in self.tables.get("chat_sessions", []) if s["id"] == row.get("session_id")]
+            row["user_id"] = sessions[0].get("user_id") if sessions else None
+        self.tables.setdefault(table, []).append(row)
+        return row
+
+    # --- RPC functions from supabase/migrations ---
+    async def rpc(self, request: Request) -> Response:
+        await self._delay("rpc")
+        function = request.path_params["function"]
+        args = await request.json()
+        if function == "record_chat_turn":
+            return self._record_chat_turn(args)
+        if function == "record_chat_turns":
+            return self._record_chat_turns(args)
+        if function == "save_chat_summary":
+            return self._save_chat_summary(args)
+        if function == "search_chat_messages":
+            return self._search_chat_messages(args)
+        if function == "chat_usage_report":
+            return self._chat_usage_report(args)
+        if function == "chat_usage_totals":
+            return self._chat_usage_totals(args)
+        return JSONResponse({"code": "PGRST202", "message": f"Unknown function {function}"}, status_code=404)
+
+    def _record_chat_turn(self, args: Dict[str, Any]) -> Response:
+        sessions = [
+            s for s in self.tables.get("chat_sessions", [])
+            if s["id"] == args["p_session_id"] and s.get("user_id") == args["p_user_id"]
+        ]
+        if not sessions:
+            return JSONResponse({"code": "P0002", "message": "chat session not found"}, status_code=400)
+        session = sessions[0]
+        session["total_tokens"] = (session.get("total_tokens") or 0) + args["p_input_tokens"] + args["p_output_tokens"]
+        session["total_cost"] = float(session.get("total_cost") or 0) + args["p_cost"]
+        session["updated_at"] = _now()
+        user_message = self._insert("chat_messages", {
+            "session_id": session["id"], "user_id": args["p_user_id"], "role": "user",
+            "content": args["p_user_content"], "tokens": args["p_user_tokens"], "cost": 0
+        })
+        assistant_message = self._insert("chat_messages", {
+            "session_id": session["id"], "role": "assistant", "content": args["p_assistant_content"],
+            "tokens": args["p_output_tokens"], "cost": args["p_cost"],
+            "saved_tokens": args.get("p_saved_tokens", 0), "saved_cost": args.get("p_saved_cost", 0),
+            "model": args.get("p_model") or session["model"]
+        })
+        self._add_rollup(session["user_id"], args.get("p_model") or session["model"], args)
+        return JSONResponse({
+            "user_message_id": user_message["id"],
+            "assistant_message_id": assistant_message["id"],
+            "updated_at": session["updated_at"],
+            "total_tokens": session["total_tokens"],
+            "total_cost": session["total_cost"],
+        })
+
+    def _record_chat_turns(self, args: Dict[str, Any]) -> Response:
+        results = []
+        for turn in args["p_turns"]:
+            response = self._record_chat_turn(turn)
+            body = json.loads(response.body)
+            results.append({"turn": body} if response.status_code == 200 else {"error": body["code"], "message": body["message"]})
+        return JSONResponse(results)
+
+    def _save_chat_summary(self, args: Dict[str, Any]) -> Response:
+        sessions = [s for s in self.tables.get("chat_sessions", []) if s["id"] == args["p_session_id"]]
+        if not sessions:
+            return JSONResponse({"code": "P0002", "message": "chat session not found"}, status_code=400)
+        session = sessions[0]
+        session["total_tokens"] = (session.get("total_tokens") or 0) + args["p_input_tokens"] + args["p_output_tokens"]
+        session["total_cost"] = float(session.get("total_cost") or 0) + args["p_cost"]
+        summaries = self.tables.setdefault("chat_session_summaries", [])
+        current = next((s for s in summaries if s["session_id"] == session["id"]), None)
+        saved = current is None or current["covered_messages"] < args["p_covered_messages"]
+        if saved:
+            if current is None:
+                current = {"session_id": session["id"]}
+                summaries.append(current)
+            current.update({
+                "summary": args["p_summary"], "covered_messages": args["p_covered_messages"],
+                "summary_tokens": args["p_summary_tokens"], "updated_at": _now()
+            })
+        self._add_rollup(session["user_id"], args["p_model"], args)
+        return JSONResponse(saved)
+
+    def _add_rollup(self, user_id: Optional[str], model: str, args: Dict[str, Any]) -> None:
+        bucket = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0).isoformat(timespec="microseconds")
+        rollups = self.tables.setdefault("chat_usage_rollups", [])
+        rollup = next((r for r in rollups if (r["user_id"], r["bucket"], r["model"]) == (user_id, bucket, model)), None)
+        if rollup is None:
+            rollup = {"user_id": user_id, "bucket": bucket, "model": model,
+                      "input_tokens": 0, "output_tokens": 0, "cost": 0.0, "requests": 0}
+            rollups.append(rollup)
+        rollup["input_tokens"] += args["p_input_tokens"]
+        rollup["output_tokens"] += args["p_output_tokens"]
+        rollup["cost"] += args["p_cost"]
+        rollup["requests"] += 1
+
+    def _chat_usage_report(self, args: Dict[str, Any]) -> Response:
+        start, end = _norm_ts(args["p_from"]), _norm_ts(args["p_to"])
+        width = 10 if args["p_granularity"] == "day" else 13
+        grouped: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for r in self.tables.get("chat_usage_rollups", []):
+            if r["user_id"] != args["p_user_id"] or not (start <= r["bucket"] < end):
+                continue
+            if args.get("p_model") and r["model"] != args["p_model"]:
+                continue
+            bucket = _norm_ts(r["bucket"][:width] + ("T00:00:00+00:00" if width == 10 else ":00:00+00:00"))
+            g = grouped.setdefault((bucket, r["model"]), {
+                "bucket": bucket, "model": r["model"], "input_tokens": 0, "output_tokens": 0, "cost": 0.0, "requests": 0
+            })
+            for field in ("input_tokens", "output_tokens", "cost", "requests"):
+                g[field] += r[field]
+        return JSONResponse([grouped[k] for k in sorted(grouped)])
+
+    def _chat_usage_totals(self, args: Dict[str, Any]) -> Response:
+        rollups = [r for r in self.tables.get("chat_usage_rollups", []) if r["user_id"] == args["p_user_id"]]
+        return JSONResponse([{
+            "total_tokens": sum(r["input_tokens"] + r["output_tokens"] for r in rollups),
+            "total_cost": sum(r["cost"] for r in rollups)
+        }])
+
+    def _search_chat_messages(self, args: Dict[str, Any]) -> Response:
+        """Term matching in place of Postgres full-text search; same result shape"""
+        terms = [t for t in re.findall(r"\w+", args["p_query"].lower())]
+        sessions = {s["id"]: s for s in self.tables.get("chat_sessions", []) if s["user_id"] == args["p_user_id"]}
+        hits = []
+        for m in self.tables.get("chat_messages", []):
+            if m.get("user_id") != args["p_user_id"] or m["session_id"] not in sessions:
+                continue
+            words = re.findall(r"\w+", m["content"].lower())
+            if not terms or not all(t in words for t in terms):
+                continue
+            rank = round(sum(words.count(t) for t in terms) / (1 + len(words)), 6)
+            if args.get("p_after_rank") is not None and (rank, m["id"]) >= (args["p_after_rank"], args["p_after_id"]):
+                continue
+            hits.append((rank, m))
+        hits.sort(key=lambda h: (h[0], h[1]["id"]), reverse=True)
+        rows = []
+        for rank, m in hits[:args.get("p_limit", 20)]:
+            snippet = " ".join(
+                f"\x02{w}\x03" if w.lower().strip(".,!?") in terms else w for w in m["content"].split()[:30]
+            )
+            rows.append({
+                "id": m["id"], "session_id": m["session_id"], "session_title": sessions[m["session_id"]]["title"],
+                "role": m["role"], "created_at": m["created_at"], "rank": rank, "snippet": snippet
+            })
+        return JSONResponse(rows)
+
+    # --- Auth ---
+    async def auth_user(self, request: Request) -> Response:
+        await self._delay("auth")
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        try:
+            claims = jwt.decode(token, self.jwt_secret, algorithms=["HS256"], audience="authenticated")
+        except jwt.PyJWTError as e:
+            return JSONResponse({"code": 401, "msg": str(e)}, status_code=401)
+        return JSONResponse({
+            "id": claims["sub"], "aud": claims["aud"], "role": claims.get("role"), "email": claims.get("email"),
+            "app_metadata": {}, "user_metadata": {}, "created_at": _now()
+        })
@@ -0,0 +1,317 @@
+"""Load-test the backend against local Supabase and OpenAI stand-ins.
+
+Usage (from backend/):
+    python -m benchmarks.run_benchmark --users 50 --turns 3
+    python -m benchmarks.run_benchmark --stream --db-latency 0.005 --json results.json
+
+Starts fake PostgREST/Auth and OpenAI servers plus the FastAPI app with
+uvicorn, then runs concurrent simulated users through a realistic flow:
+create a session, chat for a few turns, list sessions, open the session,
+fetch the usage summary, then rename and delete the session. Reports throughput, p50/p95/p99 latency per
+operation and the Supabase round trips each operation costs.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+import jwt
+import uvicorn
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.fake_supabase import FakeSupabase
+
+JWT_SECRET = "benchmark-jwt-secret-0123456789abcdef"
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+def _model_values(pairs: List[str]) -> Dict[str, float]:
+    """Parse repeated MODEL=VALUE options"""
+    values = {}
+    for pair in pairs:
+        model, _, value = pair.partition("=")
+        values[model] = float(value)
+    return values
+
+def _user_token(user_id: str) -> str:
+    now = datetime.now(timezone.utc)
+    return jwt.encode({
+        "sub": user_id,
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": f"{user_id[:8]}@bench.local",
+        "iat": now,
+        "exp": now + timedelta(hours=1),
+    }, JWT_SECRET, algorithm="HS256")
+
+@dataclass
+class OpStats:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    round_trips: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.latencies)
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+        ops = len(ordered)
+        return {
+            "ops": ops,
+            "errors": self.errors,
+            "throughput": ops / self.elapsed if self.elapsed else 0.0,
+            "mean_ms": statistics.fmean(ordered) * 1000 if ordered else 0.0,
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "db_round_trips_per_op": self.round_trips / ops if ops else 0.0,
+        }
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace, supabase: Optional[FakeSupabase]):
+        self.args = args
+        self.supabase = supabase
+        self.stats: Dict[str, OpStats] = {}
+        self.elapsed = 0.0
+
+    def _turn_body(self, session_id: str, index: int) -> dict:
+        return {
+            "message": f"Explain Kirchhoff's laws, question {index}",
+            "session_id": session_id,
+            "model": self.args.model,
+            "cache": False,
+        }
+
+    def _db_round_trips(self) -> int:
+        return sum(self.supabase.round_trips.values()) if self.supabase else 0
+
+    async def phase(self, name: str, clients: List[httpx.AsyncClient], step) -> list:
+        """Run one step for every simulated user concurrently and time each call.
+
+        Users move through the flow in lock-step so the database counter delta
+        for a phase can be attributed to a single kind of operation.
+        """
+        stats = self.stats.setdefault(name, OpStats())
+        before = self._db_round_trips()
+        started = time.perf_counter()
+
+        async def timed(client: httpx.AsyncClient, index: int):
+            start = time.perf_counter()
+            try:
+                result = await step(client, index)
+            except Exception as e:
+                stats.errors += 1
+                if self.args.verbose:
+                    detail = e.response.text if isinstance(e, httpx.HTTPStatusError) else e
+                    print(f"[{name}] {type(e).__name__}: {detail}", file=sys.stderr)
+                return None
+            stats.latencies.append(time.perf_counter() - start)
+            return result
+
+        results = await asyncio.gather(*(timed(c, i) for i, c in enumerate(clients)))
+        stats.elapsed += time.perf_counter() - started
+        stats.round_trips += self._db_round_trips() - before
+        return results
+
+    async def run(self, base_url: str) -> Dict[str, Dict[str, float]]:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        clients = [
+            httpx.AsyncClient(
+                base_url=base_url,
+                headers={"Authorization": f"Bearer {_user_token(str(uuid.uuid4()))}"},
+                timeout=self.args.timeout,
+                limits=limits
+            )
+            for _ in range(self.args.users)
+        ]
+        sessions: List[Optional[str]] = [None] * len(clients)
+
+        async def create_session(client, i):
+            resp = await client.post("/chat/sessions", json={"title": f"bench {i}", "model": self.args.model})
+            resp.raise_for_status()
+            sessions[i] = resp.json()["id"]
+
+        async def send(client, i):
+            resp = await client.post(
+                f"/chat/sessions/{sessions[i]}/messages",
+                json=self._turn_body(sessions[i], i)
+            )
+            resp.raise_for_status()
+
+        async def stream(client, i):
+            async with client.stream(
+                "POST",
+                f"/chat/sessions/{sessions[i]}/messages/stream",
+                json=self._turn_body(sessions[i], i)
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[6:])
+                    if event["type"] == "error":
+                        raise RuntimeError(f"stream ended with an error event: {event.get('detail')}")
+                    if event["type"] == "done":
+                        return
+                raise RuntimeError("stream ended without a done event")
+
+        def get(path):
+            async def step(client, i):
+                resp = await client.get(path.format(session=sessions[i]))
+                resp.raise_for_status()
+            return step
+
+        batch_sessions: List[List[str]] = [[] for _ in clients]
+
+        async def create_batch_sessions(client, i):
+            async def create(n):
+                resp = await client.post("/chat/sessions", json={"title": f"bench {i} batch {n}", "model": self.args.model})
+                resp.raise_for_status()
+                return resp.json()["id"]
+            batch_sessions[i] = await asyncio.gather(*(create(n) for n in range(self.args.batch_items)))
+
+        async def batch(client, i):
+            items = [self._turn_body(session_id, n) for n, session_id in enumerate(batch_sessions[i])]
+            async with client.stream("POST", "/chat/batch", json={"items": items}) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if line and json.loads(line)["type"] == "error":
+                        raise RuntimeError(f"batch item failed: {line}")
+
+        async def rename_session(client, i):
+            resp = await client.put(f"/chat/sessions/{sessions[i]}", json={"title": f"bench {i} (renamed)", "model": self.args.model})
+            resp.raise_for_status()
+
+        async def delete_session(client, i):
+            resp = await client.delete(f"/chat/sessions/{sessions[i]}")
+            resp.raise_for_status()
+
+        started = time.perf_counter()
+        try:
+            await self.phase("create_session", clients, create_session)
+            turn = stream if self.args.stream else send
+            for _ in range(self.args.turns):
+                await self.phase("stream_message" if self.args.stream else "send_message", clients, turn)
+            await self.phase("list_sessions", clients, get("/chat/sessions"))
+            await self.phase("get_session", clients, get("/chat/sessions/{session}"))
+            await self.phase("usage_summary", clients, get("/chat/usage/summary"))
+            await self.phase("usage_report", clients, get("/chat/usage"))
+            if self.args.batch_items:
+                await self.phase("batch_setup", clients, create_batch_sessions)
+                await self.phase("batch_message", clients, batch)
+            await self.phase("rename_session", clients, rename_session)
+            await self.phase("delete_session", clients, delete_session)
+        finally:
+            await asyncio.gather(*(c.aclose() for c in clients))
+        self.elapsed = time.perf_counter() - started
+        return {name: s.summary() for name, s in self.stats.items()}
+
+def _print_report(results: Dict[str, Dict[str, float]], elapsed: float) -> None:
+    header = f"{'operation':<16}{'ops':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db rt/op':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(
+            f"{name:<16}{r['ops']:>7}{r['errors']:>8}{r['throughput']:>9.1f}"
+            f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['db_round_trips_per_op']:>10.2f}"
+        )
+    print(f"\ntotal wall time: {elapsed:.2f}s")
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load-test the backend against local Supabase/OpenAI stand-ins")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per user")
+    parser.add_argument("--stream", action="store_true", help="use the SSE streaming endpoint for chat turns")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="seconds added to every Supabase request")
+    parser.add_argument("--db-jitter", type=float, default=0.0)
+    parser.add_argument("--ttft", type=float, default=0.2, help="OpenAI time to first token, seconds")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="delay between streamed tokens, seconds")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--model-ttft", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="time to first token for one model (repeatable)")
+    parser.add_argument("--model-error-rate", action="append", default=[], metavar="MODEL=RATE",
+                        help="fraction of requests to one model that fail with a 500 (repeatable)")
+    parser.add_argument("--hedge", action="store_true", help="enable hedged OpenAI requests")
+    parser.add_argument("--fallbacks", default="", help="MODEL_FALLBACKS for the app, e.g. gpt-4:gpt-4-turbo")
+    parser.add_argument("--summary-trigger", type=int, default=0,
+                        help="enable conversation summaries once history passes this many tokens (0 = off)")
+    parser.add_argument("--batch-items", type=int, default=0,
+                        help="also send one POST /chat/batch per user with this many items, each on its own session")
+    parser.add_argument("--remote-auth", action="store_true", help="verify every token with the fake Auth server")
+    parser.add_argument("--app-url", help="benchmark an already running app instead of starting one")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="print every failed request")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    supabase = None
+    base_url = args.app_url
+    if not base_url:
+        supabase = FakeSupabase(latency=args.db_latency, jitter=args.db_jitter, jwt_secret=JWT_SECRET)
+        openai = FakeOpenAI(
+            ttft=args.ttft,
+            token_delay=args.token_delay,
+            reply_tokens=args.reply_tokens,
+            model_ttft=_model_values(args.model_ttft),
+            error_rates=_model_values(args.model_error_rate)
+        )
+        supabase_port, openai_port, app_port = _free_port(), _free_port(), _free_port()
+        _serve(supabase.app, supabase_port)
+        _serve(openai.app, openai_port)
+
+        # Settings are read at import time, so configure them before importing the app
+        os.environ.update({
+            "SUPABASE_URL": f"http://127.0.0.1:{supabase_port}",
+            "SUPABASE_SERVICE_ROLE_KEY": jwt.encode({"role": "service_role"}, JWT_SECRET, algorithm="HS256"),
+            "JWT_SECRET_KEY": JWT_SECRET,
+            "AUTH_REMOTE_VERIFY": "true" if args.remote_auth else "false",
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+            "RATE_LIMIT_ENABLED": "false",
+            "COMPLETION_CACHE_ENABLED": "false",
+            "OPENAI_MAX_RETRIES": "0",
+            "ROUTING_HEDGE_ENABLED": "true" if args.hedge else "false",
+            "ROUTING_MIN_SAMPLES": "10",
+            "MODEL_FALLBACKS": args.fallbacks,
+            "SUMMARY_ENABLED": "true" if args.summary_trigger else "false",
+            "SUMMARY_TRIGGER_TOKENS": str(args.summary_trigger),
+        })
+        from app.main import app
+        _serve(app, app_port)
+        base_url = f"http://127.0.0.1:{app_port}"
+
+    bench = Benchmark(args, supabase)
+    results = asyncio.run(bench.run(base_url))
+    _print_report(results, bench.elapsed)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": vars(args), "elapsed": bench.elapsed, "results": results}, f, indent=2)
+    return 1 if any(r["errors"] for r in results.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+-- Persist one chat turn in a single round trip: both messages are inserted and
+-- the session totals are incremented in place, so concurrent turns on the same
+-- session cannot overwrite each other's totals.
+create or replace function public.record_chat_turn(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_user_content text,
+    p_user_tokens integer,
+    p_assistant_content text,
+    p_input_tokens integer,
+    p_output_tokens integer,
+    p_cost numeric
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_total_tokens bigint;
+    v_total_cost numeric;
+    v_user_message_id uuid;
+    v_assistant_message_id uuid;
+begin
+    -- Row lock on the session serialises concurrent turns for the rest of the transaction
+    update public.chat_sessions
+       set total_tokens = coalesce(total_tokens, 0) + p_input_tokens + p_output_tokens,
+           total_cost = coalesce(total_cost, 0) + p_cost,
+           updated_at = now()
+     where id = p_session_id
+    returning total_tokens, total_cost
+         into v_total_tokens, v_total_cost;
+
+    if not found then
+        raise exception 'chat session % not found', p_session_id using errcode = 'P0002';
+    end if;
+
+    insert into public.chat_messages (session_id, user_id, role, content, tokens, cost, created_at)
+    values (p_session_id, p_user_id, 'user', p_user_content, p_user_tokens, 0, now())
+    returning id into v_user_message_id;
+
+    -- clock_timestamp() keeps the reply ordered after the user message within the transaction
+    insert into public.chat_messages (session_id, role, content, tokens, cost, created_at)
+    values (p_session_id, 'assistant', p_assistant_content, p_output_tokens, p_cost, clock_timestamp())
+    returning id into v_assistant_message_id;
+
+    return jsonb_build_object(
+        'user_message_id', v_user_message_id,
+        'assistant_message_id', v_assistant_message_id,
+        -- Re-read so the value is formatted exactly as PostgREST returns the column
+        'updated_at', (select updated_at from public.chat_sessions where id = p_session_id),
+        'total_tokens', v_total_tokens,
+        'total_cost', v_total_cost
+    );
+end;
+$$;
+
+-- Only the backend (service role) may record turns
+revoke execute on function public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric) from public, anon, authenticated;
+grant execute on function public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric) to service_role;
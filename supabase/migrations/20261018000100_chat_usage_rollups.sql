@@ -0,0 +1,163 @@
+-- Hourly usage counters per user and model, maintained by record_chat_turn so
+-- usage reports read a few pre-aggregated rows instead of scanning history.
+-- Anonymous usage is recorded under a null user_id.
+create table if not exists public.chat_usage_rollups (
+    user_id uuid,
+    bucket timestamptz not null,
+    model text not null,
+    input_tokens bigint not null default 0,
+    output_tokens bigint not null default 0,
+    cost numeric not null default 0,
+    requests integer not null default 0,
+    constraint chat_usage_rollups_key unique nulls not distinct (user_id, bucket, model)
+);
+
+alter table public.chat_usage_rollups enable row level security;
+
+-- Backfill from the turns recorded before this migration. Each assistant
+-- message holds its reply's output tokens and the turn's full cost; prompt
+-- tokens only exist in the session total, so they are spread over the
+-- session's replies (exactly, so per-session sums match the totals).
+with replies as (
+    select m.session_id,
+           m.created_at,
+           coalesce(m.tokens, 0)::bigint as output_tokens,
+           coalesce(m.cost, 0) as cost,
+           row_number() over w as n,
+           count(*) over (partition by m.session_id) as replies,
+           sum(coalesce(m.tokens, 0)) over (partition by m.session_id) as session_output
+      from public.chat_messages m
+     where m.role = 'assistant'
+    window w as (partition by m.session_id order by m.created_at, m.id)
+),
+turns as (
+    select s.user_id,
+           date_trunc('hour', r.created_at) as bucket,
+           s.model,
+           r.output_tokens,
+           r.cost,
+           greatest(coalesce(s.total_tokens, 0) - r.session_output, 0)::bigint * r.n / r.replies
+             - greatest(coalesce(s.total_tokens, 0) - r.session_output, 0)::bigint * (r.n - 1) / r.replies as input_tokens
+      from replies r
+      join public.chat_sessions s on s.id = r.session_id
+)
+insert into public.chat_usage_rollups (user_id, bucket, model, input_tokens, output_tokens, cost, requests)
+select user_id, bucket, model, sum(input_tokens), sum(output_tokens), sum(cost), count(*)
+  from turns
+ group by user_id, bucket, model
+on conflict on constraint chat_usage_rollups_key do nothing;
+
+create or replace function public.record_chat_turn(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_user_content text,
+    p_user_tokens integer,
+    p_assistant_content text,
+    p_input_tokens integer,
+    p_output_tokens integer,
+    p_cost numeric
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_total_tokens bigint;
+    v_total_cost numeric;
+    v_session_user_id uuid;
+    v_model text;
+    v_user_message_id uuid;
+    v_assistant_message_id uuid;
+begin
+    -- Row lock on the session serialises concurrent turns for the rest of the transaction
+    update public.chat_sessions
+       set total_tokens = coalesce(total_tokens, 0) + p_input_tokens + p_output_tokens,
+           total_cost = coalesce(total_cost, 0) + p_cost,
+           updated_at = now()
+     where id = p_session_id
+    returning total_tokens, total_cost, user_id, model
+         into v_total_tokens, v_total_cost, v_session_user_id, v_model;
+
+    if not found then
+        raise exception 'chat session % not found', p_session_id using errcode = 'P0002';
+    end if;
+
+    insert into public.chat_messages (session_id, user_id, role, content, tokens, cost, created_at)
+    values (p_session_id, p_user_id, 'user', p_user_content, p_user_tokens, 0, now())
+    returning id into v_user_message_id;
+
+    -- clock_timestamp() keeps the reply ordered after the user message within the transaction
+    insert into public.chat_messages (session_id, role, content, tokens, cost, created_at)
+    values (p_session_id, 'assistant', p_assistant_content, p_output_tokens, p_cost, clock_timestamp())
+    returning id into v_assistant_message_id;
+
+    insert into public.chat_usage_rollups as r (user_id, bucket, model, input_tokens, output_tokens, cost, requests)
+    values (v_session_user_id, date_trunc('hour', now()), v_model, p_input_tokens, p_output_tokens, p_cost, 1)
+    on conflict on constraint chat_usage_rollups_key do update
+       set input_tokens = r.input_tokens + excluded.input_tokens,
+           output_tokens = r.output_tokens + excluded.output_tokens,
+           cost = r.cost + excluded.cost,
+           requests = r.requests + 1;
+
+    return jsonb_build_object(
+        'user_message_id', v_user_message_id,
+        'assistant_message_id', v_assistant_message_id,
+        -- Re-read so the value is formatted exactly as PostgREST returns the column
+        'updated_at', (select updated_at from public.chat_sessions where id = p_session_id),
+        'total_tokens', v_total_tokens,
+        'total_cost', v_total_cost
+    );
+end;
+$$;
+
+-- Usage for one user (null = anonymous) grouped by hour or day and model
+create or replace function public.chat_usage_report(
+    p_user_id uuid,
+    p_from timestamptz,
+    p_to timestamptz,
+    p_granularity text,
+    p_model text default null
+) returns table (
+    bucket timestamptz,
+    model text,
+    input_tokens bigint,
+    output_tokens bigint,
+    cost numeric,
+    requests bigint
+)
+language sql
+stable
+as $$
+    select date_trunc(p_granularity, r.bucket, 'UTC') as bucket,
+           r.model,
+           sum(r.input_tokens)::bigint,
+           sum(r.output_tokens)::bigint,
+           sum(r.cost),
+           sum(r.requests)::bigint
+      from public.chat_usage_rollups r
+     where ((p_user_id is null and r.user_id is null) or r.user_id = p_user_id)
+       and r.bucket >= p_from
+       and r.bucket < p_to
+       and (p_model is null or r.model = p_model)
+     group by 1, 2
+     order by 1, 2;
+$$;
+
+revoke execute on function public.chat_usage_report(uuid, timestamptz, timestamptz, text, text) from public, anon, authenticated;
+grant execute on function public.chat_usage_report(uuid, timestamptz, timestamptz, text, text) to service_role;
+
+-- All-time usage for one user (null = anonymous), for the usage summary
+create or replace function public.chat_usage_totals(p_user_id uuid)
+returns table (
+    total_tokens bigint,
+    total_cost numeric
+)
+language sql
+stable
+as $$
+    select coalesce(sum(r.input_tokens + r.output_tokens), 0)::bigint,
+           coalesce(sum(r.cost), 0)
+      from public.chat_usage_rollups r
+     where (p_user_id is null and r.user_id is null) or r.user_id = p_user_id;
+$$;
+
+revoke execute on function public.chat_usage_totals(uuid) from public, anon, authenticated;
+grant execute on function public.chat_usage_totals(uuid) to service_role;
@@ -0,0 +1,142 @@
+-- Running summary of the older turns of a long session. The backend sends the
+-- summary plus the messages after covered_messages instead of the full
+-- transcript. One row per session, removed with the session.
+create table if not exists public.chat_session_summaries (
+    session_id uuid primary key references public.chat_sessions (id) on delete cascade,
+    summary text not null,
+    covered_messages integer not null,
+    summary_tokens integer not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+alter table public.chat_session_summaries enable row level security;
+
+-- Prompt tokens (and their cost) the summary saved on the turn that produced a reply
+alter table public.chat_messages
+    add column if not exists saved_tokens integer not null default 0,
+    add column if not exists saved_cost numeric not null default 0;
+
+-- Store a newer summary and bill the summarization call to the session.
+-- A summary covering no more messages than the stored one is discarded, so
+-- overlapping refreshes from different workers cannot move it backwards.
+create or replace function public.save_chat_summary(
+    p_session_id uuid,
+    p_summary text,
+    p_covered_messages integer,
+    p_summary_tokens integer,
+    p_model text,
+    p_input_tokens integer,
+    p_output_tokens integer,
+    p_cost numeric
+) returns boolean
+language plpgsql
+as $$
+declare
+    v_session_user_id uuid;
+    v_saved boolean;
+begin
+    -- updated_at is left alone: the transcript did not change
+    update public.chat_sessions
+       set total_tokens = coalesce(total_tokens, 0) + p_input_tokens + p_output_tokens,
+           total_cost = coalesce(total_cost, 0) + p_cost
+     where id = p_session_id
+    returning user_id into v_session_user_id;
+
+    if not found then
+        raise exception 'chat session % not found', p_session_id using errcode = 'P0002';
+    end if;
+
+    insert into public.chat_session_summaries as s (session_id, summary, covered_messages, summary_tokens, updated_at)
+    values (p_session_id, p_summary, p_covered_messages, p_summary_tokens, now())
+    on conflict (session_id) do update
+       set summary = excluded.summary,
+           covered_messages = excluded.covered_messages,
+           summary_tokens = excluded.summary_tokens,
+           updated_at = excluded.updated_at
+     where s.covered_messages < excluded.covered_messages;
+    v_saved := found;
+
+    insert into public.chat_usage_rollups as r (user_id, bucket, model, input_tokens, output_tokens, cost, requests)
+    values (v_session_user_id, date_trunc('hour', now()), p_model, p_input_tokens, p_output_tokens, p_cost, 1)
+    on conflict on constraint chat_usage_rollups_key do update
+       set input_tokens = r.input_tokens + excluded.input_tokens,
+           output_tokens = r.output_tokens + excluded.output_tokens,
+           cost = r.cost + excluded.cost,
+           requests = r.requests + 1;
+
+    return v_saved;
+end;
+$$;
+
+revoke execute on function public.save_chat_summary(uuid, text, integer, integer, text, integer, integer, numeric) from public, anon, authenticated;
+grant execute on function public.save_chat_summary(uuid, text, integer, integer, text, integer, integer, numeric) to service_role;
+
+-- record_chat_turn gains the summary savings of the reply. The old signature is
+-- dropped rather than overloaded so PostgREST resolves the call unambiguously.
+drop function if exists public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric);
+
+create or replace function public.record_chat_turn(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_user_content text,
+    p_user_tokens integer,
+    p_assistant_content text,
+    p_input_tokens integer,
+    p_output_tokens integer,
+    p_cost numeric,
+    p_saved_tokens integer default 0,
+    p_saved_cost numeric default 0
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_total_tokens bigint;
+    v_total_cost numeric;
+    v_session_user_id uuid;
+    v_model text;
+    v_user_message_id uuid;
+    v_assistant_message_id uuid;
+begin
+    -- Row lock on the session serialises concurrent turns for the rest of the transaction
+    update public.chat_sessions
+       set total_tokens = coalesce(total_tokens, 0) + p_input_tokens + p_output_tokens,
+           total_cost = coalesce(total_cost, 0) + p_cost,
+           updated_at = now()
+     where id = p_session_id
+    returning total_tokens, total_cost, user_id, model
+         into v_total_tokens, v_total_cost, v_session_user_id, v_model;
+
+    if not found then
+        raise exception 'chat session % not found', p_session_id using errcode = 'P0002';
+    end if;
+
+    insert into public.chat_messages (session_id, user_id, role, content, tokens, cost, created_at)
+    values (p_session_id, p_user_id, 'user', p_user_content, p_user_tokens, 0, now())
+    returning id into v_user_message_id;
+
+    -- clock_timestamp() keeps the reply ordered after the user message within the transaction
+    insert into public.chat_messages (session_id, role, content, tokens, cost, saved_tokens, saved_cost, created_at)
+    values (p_session_id, 'assistant', p_assistant_content, p_output_tokens, p_cost, p_saved_tokens, p_saved_cost, clock_timestamp())
+    returning id into v_assistant_message_id;
+
+    insert into public.chat_usage_rollups as r (user_id, bucket, model, input_tokens, output_tokens, cost, requests)
+    values (v_session_user_id, date_trunc('hour', now()), v_model, p_input_tokens, p_output_tokens, p_cost, 1)
+    on conflict on constraint chat_usage_rollups_key do update
+       set input_tokens = r.input_tokens + excluded.input_tokens,
+           output_tokens = r.output_tokens + excluded.output_tokens,
+           cost = r.cost + excluded.cost,
+           requests = r.requests + 1;
+
+    return jsonb_build_object(
+        'user_message_id', v_user_message_id,
+        'assistant_message_id', v_assistant_message_id,
+        -- Re-read so the value is formatted exactly as PostgREST returns the column
+        'updated_at', (select updated_at from public.chat_sessions where id = p_session_id),
+        'total_tokens', v_total_tokens,
+        'total_cost', v_total_cost
+    );
+end;
+$$;
+
+revoke execute on function public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric, integer, numeric) from public, anon, authenticated;
+grant execute on function public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric, integer, numeric) to service_role;
@@ -0,0 +1,73 @@
+-- Model that produced each assistant reply. The backend may answer with a
+-- fallback model when the session's model is degraded, and the reply is billed
+-- and rolled up under the model that actually ran.
+alter table public.chat_messages add column if not exists model text;
+
+drop function if exists public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric, integer, numeric);
+
+create or replace function public.record_chat_turn(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_user_content text,
+    p_user_tokens integer,
+    p_assistant_content text,
+    p_input_tokens integer,
+    p_output_tokens integer,
+    p_cost numeric,
+    p_saved_tokens integer default 0,
+    p_saved_cost numeric default 0,
+    p_model text default null
+) returns jsonb
+language plpgsql
+as $$
+declare
+    v_total_tokens bigint;
+    v_total_cost numeric;
+    v_session_user_id uuid;
+    v_model text;
+    v_user_message_id uuid;
+    v_assistant_message_id uuid;
+begin
+    -- Row lock on the session serialises concurrent turns for the rest of the transaction
+    update public.chat_sessions
+       set total_tokens = coalesce(total_tokens, 0) + p_input_tokens + p_output_tokens,
+           total_cost = coalesce(total_cost, 0) + p_cost,
+           updated_at = now()
+     where id = p_session_id
+    returning total_tokens, total_cost, user_id, coalesce(p_model, model)
+         into v_total_tokens, v_total_cost, v_session_user_id, v_model;
+
+    if not found then
+        raise exception 'chat session % not found', p_session_id using errcode = 'P0002';
+    end if;
+
+    insert into public.chat_messages (session_id, user_id, role, content, tokens, cost, created_at)
+    values (p_session_id, p_user_id, 'user', p_user_content, p_user_tokens, 0, now())
+    returning id into v_user_message_id;
+
+    -- clock_timestamp() keeps the reply ordered after the user message within the transaction
+    insert into public.chat_messages (session_id, role, content, tokens, cost, saved_tokens, saved_cost, model, created_at)
+    values (p_session_id, 'assistant', p_assistant_content, p_output_tokens, p_cost, p_saved_tokens, p_saved_cost, v_model, clock_timestamp())
+    returning id into v_assistant_message_id;
+
+    insert into public.chat_usage_rollups as r (user_id, bucket, model, input_tokens, output_tokens, cost, requests)
+    values (v_session_user_id, date_trunc('hour', now()), v_model, p_input_tokens, p_output_tokens, p_cost, 1)
+    on conflict on constraint chat_usage_rollups_key do update
+       set input_tokens = r.input_tokens + excluded.input_tokens,
+           output_tokens = r.output_tokens + excluded.output_tokens,
+           cost = r.cost + excluded.cost,
+           requests = r.requests + 1;
+
+    return jsonb_build_object(
+        'user_message_id', v_user_message_id,
+        'assistant_message_id', v_assistant_message_id,
+        -- Re-read so the value is formatted exactly as PostgREST returns the column
+        'updated_at', (select updated_at from public.chat_sessions where id = p_session_id),
+        'total_tokens', v_total_tokens,
+        'total_cost', v_total_cost
+    );
+end;
+$$;
+
+revoke execute on function public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric, integer, numeric, text) from public, anon, authenticated;
+grant execute on function public.record_chat_turn(uuid, uuid, text, integer, text, integer, integer, numeric, integer, numeric, text) to service_role;
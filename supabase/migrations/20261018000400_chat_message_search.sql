@@ -0,0 +1,85 @@
+-- Full-text search over chat messages through an expression GIN index, so a
+-- search touches only matching rows instead of scanning every transcript. An
+-- expression index rather than a stored tsvector column keeps select * on
+-- chat_messages (history loads, exports) free of the extra payload. Queries
+-- must use the same to_tsvector('english', content) expression to hit it.
+--
+-- The index leads with user_id so a search is scoped to one user's messages
+-- inside the index, rather than matching every user's rows and filtering them
+-- after the join to chat_sessions. chat_messages.user_id was only set on user
+-- messages; it now always carries the session owner.
+create extension if not exists btree_gin with schema extensions;
+
+update public.chat_messages m
+   set user_id = s.user_id
+  from public.chat_sessions s
+ where s.id = m.session_id
+   and m.user_id is distinct from s.user_id;
+
+create or replace function public.set_chat_message_user_id()
+returns trigger
+language plpgsql
+as $$
+begin
+    select s.user_id into new.user_id
+      from public.chat_sessions s
+     where s.id = new.session_id;
+    return new;
+end;
+$$;
+
+drop trigger if exists chat_messages_set_user_id on public.chat_messages;
+create trigger chat_messages_set_user_id
+    before insert or update of session_id on public.chat_messages
+    for each row execute function public.set_chat_message_user_id();
+
+create index if not exists chat_messages_user_content_fts_idx
+    on public.chat_messages using gin (user_id, to_tsvector('english', content));
+
+-- Ranked matches across one user's sessions, best match first.
+-- Pages continue strictly after (p_after_rank, p_after_id) in (rank desc, id desc)
+-- order. Snippets are computed for the returned page only; matched terms are
+-- wrapped in chr(2)/chr(3) so the caller can escape the text before marking them up.
+create or replace function public.search_chat_messages(
+    p_user_id uuid,
+    p_query text,
+    p_limit integer default 20,
+    p_after_rank real default null,
+    p_after_id uuid default null
+) returns table (
+    id uuid,
+    session_id uuid,
+    session_title text,
+    role text,
+    created_at timestamptz,
+    rank real,
+    snippet text
+)
+language sql
+stable
+as $$
+    with query as (
+        select websearch_to_tsquery('english', p_query) as q
+    ), page as (
+        select m.id, m.session_id, s.title, m.role, m.created_at, m.content,
+               ts_rank_cd(to_tsvector('english', m.content), query.q) as rank
+          from public.chat_messages m
+          join public.chat_sessions s on s.id = m.session_id
+         cross join query
+         where m.user_id = p_user_id
+           and to_tsvector('english', m.content) @@ query.q
+           and (p_after_rank is null
+                or (ts_rank_cd(to_tsvector('english', m.content), query.q), m.id) < (p_after_rank, p_after_id))
+         order by rank desc, m.id desc
+         limit p_limit
+    )
+    select page.id, page.session_id, page.title, page.role, page.created_at, page.rank,
+           ts_headline('english', page.content, query.q,
+                       format('StartSel=%s, StopSel=%s, MaxWords=30, MinWords=10, MaxFragments=2', chr(2), chr(3)))
+      from page
+     cross join query
+     order by page.rank desc, page.id desc;
+$$;
+
+revoke execute on function public.search_chat_messages(uuid, text, integer, real, uuid) from public, anon, authenticated;
+grant execute on function public.search_chat_messages(uuid, text, integer, real, uuid) to service_role;
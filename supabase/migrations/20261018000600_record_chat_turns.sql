@@ -0,0 +1,40 @@
+-- Record several chat turns in one call, for the batch endpoint. Each element
+-- of p_turns holds the named arguments of record_chat_turn. Every turn runs
+-- in its own subtransaction, so one failing turn (e.g. its session was
+-- deleted) is rolled back and reported without affecting the others.
+-- Returns one object per input, in order: {"turn": <record_chat_turn result>}
+-- or {"error": <sqlstate>, "message": <text>}.
+create or replace function public.record_chat_turns(p_turns jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_turn jsonb;
+    v_results jsonb := '[]'::jsonb;
+begin
+    for v_turn in select value from jsonb_array_elements(p_turns)
+    loop
+        begin
+            v_results := v_results || jsonb_build_array(jsonb_build_object('turn', public.record_chat_turn(
+                (v_turn->>'p_session_id')::uuid,
+                (v_turn->>'p_user_id')::uuid,
+                v_turn->>'p_user_content',
+                (v_turn->>'p_user_tokens')::integer,
+                v_turn->>'p_assistant_content',
+                (v_turn->>'p_input_tokens')::integer,
+                (v_turn->>'p_output_tokens')::integer,
+                (v_turn->>'p_cost')::numeric,
+                coalesce((v_turn->>'p_saved_tokens')::integer, 0),
+                coalesce((v_turn->>'p_saved_cost')::numeric, 0),
+                v_turn->>'p_model'
+            )));
+        exception when others then
+            v_results := v_results || jsonb_build_array(jsonb_build_object('error', sqlstate, 'message', sqlerrm));
+        end;
+    end loop;
+    return v_results;
+end;
+$$;
+
+revoke execute on function public.record_chat_turns(jsonb) from public, anon, authenticated;
+grant execute on function public.record_chat_turns(jsonb) to service_role;